@@ -1,5 +1,6 @@
 from fastapi import FastAPI, WebSocket, Response, HTTPException, Request, Depends
-from twilio.rest import Client
+from twilio_async import AsyncTwilioClient
+from call_store import CallStore
 from twilio.request_validator import RequestValidator
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 from dotenv import load_dotenv
@@ -30,11 +31,12 @@ app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Initialize clients
-twilio_client = Client(
+twilio_client = AsyncTwilioClient(
     os.getenv('TWILIO_ACCOUNT_SID'),
     os.getenv('TWILIO_AUTH_TOKEN')
 )
 openai_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+call_store = CallStore()
 
 # JWT settings
 JWT_SECRET = os.getenv('JWT_SECRET', os.urandom(32).hex())
@@ -85,11 +87,12 @@ async def start_call(call_request: CallRequest, request: Request):
         
         # Twilio üzerinden arama başlat
         answer_url = os.getenv('TWILIO_ANSWER_URL') or f"https://{os.getenv('PUBLIC_HOST')}/answer"
-        call = twilio_client.calls.create(
+        call = await twilio_client.create_call(
             to=call_request.to_number,
             from_=os.getenv('TWILIO_PHONE_NUMBER'),
             url=answer_url
         )
+        call_store.update(call.sid, "created", status=call.status, to=call_request.to_number)
         return {"status": "success", "call_sid": call.sid}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -203,6 +206,7 @@ async def webhook_status(data: dict):
         status = data.get("status")
         
         print(f"Call {call_sid} status: {status}")
+        call_store.update(call_sid, "status", status=status)
         return {"status": "received"}
         
     except Exception as e:
@@ -229,7 +233,7 @@ async def start_dynamic_call(to_number: str, agent_type: str = "default", custom
     """Dinamik arama başlat"""
     try:
         # Twilio ile arama yap
-        call = twilio_client.calls.create(
+        call = await twilio_client.create_call(
             to=to_number,
             from_=os.getenv('TWILIO_PHONE_NUMBER'),
             url=f"https://{os.getenv('PUBLIC_HOST')}/answer"
@@ -1,5 +1,5 @@
 from fastapi import FastAPI, WebSocket, Response, HTTPException, Request, Depends
-from twilio.rest import Client
+from twilio_async import AsyncTwilioClient
 from twilio.request_validator import RequestValidator
 from starlette.middleware.proxy_headers import ProxyHeadersMiddleware
 from starlette.middleware.trustedhost import TrustedHostMiddleware
@@ -32,7 +32,7 @@ app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Initialize clients
-twilio_client = Client(
+twilio_client = AsyncTwilioClient(
     os.getenv('TWILIO_ACCOUNT_SID'),
     os.getenv('TWILIO_AUTH_TOKEN')
 )
@@ -86,7 +86,7 @@ async def start_call(call_request: CallRequest, request: Request):
         stream_token = create_stream_token()
         
         # Twilio üzerinden arama başlat
-        call = twilio_client.calls.create(
+        call = await twilio_client.create_call(
             to=call_request.to_number,
             from_=os.getenv('TWILIO_PHONE_NUMBER'),
             url=f"https://{os.getenv('PUBLIC_HOST')}/answer"
@@ -0,0 +1,169 @@
+"""
+Vectorized telephony audio codecs - μ-law (G.711) and 8k <-> 16k resampling.
+
+Drop-in replacement for the audioop functions AudioBridge used
+(ulaw2lin, lin2ulaw, ratecv), which are gone in Python 3.13. μ-law
+goes through lookup tables; resampling uses a polyphase half-band FIR
+that carries its filter history across frames. The *_batch functions
+convert frames from many calls in one NumPy operation.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# --- μ-law ---------------------------------------------------------------
+
+_ULAW_BIAS = 0x84
+_ULAW_CLIP = 8159  # 14-bit magnitude limit
+
+def _build_decode_table():
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + _ULAW_BIAS) << exponent) - _ULAW_BIAS
+    return np.where(sign != 0, -magnitude, magnitude).astype(np.int16)
+
+def _build_encode_table():
+    # Indexed by the int16 sample reinterpreted as uint16; bit-exact with audioop.lin2ulaw
+    samples = np.arange(65536, dtype=np.int32)
+    samples = np.where(samples >= 32768, samples - 65536, samples) >> 2  # 14-bit
+    sign = np.where(samples < 0, 0x80, 0x00)
+    magnitude = np.minimum(np.abs(samples), _ULAW_CLIP) + (_ULAW_BIAS >> 2)
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 5
+    mantissa = (magnitude >> (np.clip(exponent, 0, 7) + 1)) & 0x0F
+    code = np.where(exponent > 7, 0x7F, (np.clip(exponent, 0, 7) << 4) | mantissa)
+    return (~(sign | code) & 0xFF).astype(np.uint8)
+
+ULAW_DECODE_TABLE = _build_decode_table()
+ULAW_ENCODE_TABLE = _build_encode_table()
+
+def ulaw_decode(ulaw_bytes) -> np.ndarray:
+    """μ-law bytes -> int16 samples"""
+    return ULAW_DECODE_TABLE[np.frombuffer(ulaw_bytes, dtype=np.uint8)]
+
+def ulaw_encode(pcm) -> bytes:
+    """int16 samples (array or little-endian bytes) -> μ-law bytes"""
+    if not isinstance(pcm, np.ndarray):
+        pcm = np.frombuffer(pcm, dtype="<i2")
+    return ULAW_ENCODE_TABLE[pcm.astype(np.int16, copy=False).view(np.uint16)].tobytes()
+
+# --- 2x resampling -------------------------------------------------------
+
+FILTER_TAPS = 32     # even, so both polyphase branches have FILTER_TAPS // 2 taps
+FILTER_CUTOFF = 0.45  # fraction of the 16 kHz Nyquist (3.6 kHz), keeps the phone band
+
+def _design_halfband(taps=FILTER_TAPS, cutoff=FILTER_CUTOFF, beta=8.0):
+    n = np.arange(taps) - (taps - 1) / 2
+    h = cutoff * np.sinc(cutoff * n) * np.kaiser(taps, beta)
+    return h / h.sum()
+
+LOWPASS = _design_halfband()
+# Polyphase branches for interpolation, reversed so a dot product is a convolution
+_UP_PHASES = np.stack([LOWPASS[0::2][::-1], LOWPASS[1::2][::-1]]) * 2.0
+_DOWN_KERNEL = LOWPASS[::-1]
+
+def _to_int16(samples):
+    return np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+
+class Upsampler:
+    """8 kHz -> 16 kHz, keeping filter history between frames"""
+
+    def __init__(self):
+        self.history = np.zeros(_UP_PHASES.shape[1] - 1)
+
+    def process(self, pcm8k: np.ndarray) -> np.ndarray:
+        if not len(pcm8k):
+            return np.zeros(0, dtype=np.int16)
+        extended = np.concatenate((self.history, pcm8k))
+        self.history = extended[len(pcm8k):]
+        out = np.empty(2 * len(pcm8k))
+        out[0::2] = np.convolve(extended, _UP_PHASES[0][::-1], "valid")
+        out[1::2] = np.convolve(extended, _UP_PHASES[1][::-1], "valid")
+        return _to_int16(out)
+
+class Downsampler:
+    """16 kHz -> 8 kHz, keeping filter history (and an odd leftover sample) between chunks"""
+
+    def __init__(self):
+        self.history = np.zeros(len(_DOWN_KERNEL) - 1)
+        self.pending = np.zeros(0)
+
+    def process(self, pcm16k: np.ndarray) -> np.ndarray:
+        samples = np.concatenate([self.pending, pcm16k])
+        usable = len(samples) - len(samples) % 2
+        self.pending = samples[usable:]
+        if not usable:
+            return np.zeros(0, dtype=np.int16)
+        extended = np.concatenate((self.history, samples[:usable]))
+        self.history = extended[usable:]
+        return _to_int16(np.convolve(extended, _DOWN_KERNEL[::-1], "valid")[1::2])
+
+def upsample_batch(states, frames: np.ndarray) -> np.ndarray:
+    """Upsample equal-length frames from several calls: (calls, n) -> (calls, 2n) int16"""
+    if not frames.shape[1]:
+        return np.zeros((frames.shape[0], 0), dtype=np.int16)
+    history = np.stack([s.history for s in states])
+    extended = np.concatenate([history, frames], axis=1)
+    windows = sliding_window_view(extended, _UP_PHASES.shape[1], axis=1)
+    out = np.empty((frames.shape[0], frames.shape[1] * 2))
+    out[:, 0::2] = windows @ _UP_PHASES[0]
+    out[:, 1::2] = windows @ _UP_PHASES[1]
+    keep = history.shape[1]
+    for i, state in enumerate(states):
+        state.history = extended[i, -keep:]
+    return _to_int16(out)
+
+def downsample_batch(states, frames: np.ndarray) -> np.ndarray:
+    """Downsample equal, even-length frames from several calls: (calls, n) -> (calls, n/2) int16"""
+    if not frames.shape[1]:
+        return np.zeros((frames.shape[0], 0), dtype=np.int16)
+    history = np.stack([s.history for s in states])
+    extended = np.concatenate([history, frames], axis=1)
+    windows = sliding_window_view(extended, len(_DOWN_KERNEL), axis=1)[:, 1::2]
+    out = windows @ _DOWN_KERNEL
+    keep = history.shape[1]
+    for i, state in enumerate(states):
+        state.history = extended[i, -keep:]
+    return _to_int16(out)
+
+# --- Batch conversions for the media path -------------------------------
+
+def _group_by_length(items):
+    groups = {}
+    for index, data in enumerate(items):
+        groups.setdefault(len(data), []).append(index)
+    return groups.items()
+
+def ulaw8k_to_pcm16_16k_batch(upsamplers, ulaw_frames):
+    """Decode and upsample one μ-law frame per call; returns (pcm8k arrays, pcm16k bytes)"""
+    pcm8k = [None] * len(ulaw_frames)
+    pcm16k = [None] * len(ulaw_frames)
+    for length, indexes in _group_by_length(ulaw_frames):
+        codes = np.frombuffer(b"".join(ulaw_frames[i] for i in indexes), dtype=np.uint8)
+        decoded = ULAW_DECODE_TABLE[codes].reshape(len(indexes), length)
+        upsampled = upsample_batch([upsamplers[i] for i in indexes], decoded)
+        for row, i in enumerate(indexes):
+            pcm8k[i] = decoded[row]
+            pcm16k[i] = upsampled[row].tobytes()
+    return pcm8k, pcm16k
+
+def pcm16_16k_to_ulaw8k_batch(downsamplers, pcm_chunks):
+    """Downsample and μ-law encode one PCM16 16k chunk per call"""
+    out = [None] * len(pcm_chunks)
+    batchable = []
+    for i, chunk in enumerate(pcm_chunks):
+        samples = np.frombuffer(chunk, dtype="<i2")
+        if len(downsamplers[i].pending) or len(samples) % 2:
+            out[i] = ulaw_encode(downsamplers[i].process(samples))  # odd alignment, do it alone
+        else:
+            batchable.append((i, samples))
+    groups = {}
+    for i, samples in batchable:
+        groups.setdefault(len(samples), []).append((i, samples))
+    for group in groups.values():
+        frames = np.stack([samples for _, samples in group]).astype(np.float64)
+        downsampled = downsample_batch([downsamplers[i] for i, _ in group], frames)
+        encoded = ULAW_ENCODE_TABLE[downsampled.view(np.uint16)]
+        for row, (i, _) in enumerate(group):
+            out[i] = encoded[row].tobytes()
+    return out
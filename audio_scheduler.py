@@ -0,0 +1,154 @@
+"""
+Outbound audio scheduler - paces μ-law frames to Twilio on a monotonic clock
+"""
+import os
+import asyncio
+
+PLAYOUT_PREFILL_FRAMES = int(os.getenv("PLAYOUT_PREFILL_FRAMES", "3"))  # burst at talk-spurt start
+PLAYOUT_MAX_LAG_MS = int(os.getenv("PLAYOUT_MAX_LAG_MS", "100"))        # resync after a longer stall
+PLAYOUT_FRAMES_PER_MESSAGE = int(os.getenv("PLAYOUT_FRAMES_PER_MESSAGE", "5"))  # 100 ms per media message
+
+class PlayoutMark:
+    """Queue entry marking a point in the audio; sent once every frame before it is out"""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+class OutboundAudioScheduler:
+    """Per-call playout queue that sends frames at real-time rate.
+
+    Deadlines advance by exactly one frame duration per frame sent, so the
+    time spent encoding and sending does not accumulate as drift. Each talk
+    spurt starts with a short burst of ``prefill_frames`` to prime Twilio's
+    jitter buffer. ``flush`` drops everything still queued immediately.
+
+    Frames that are already queued go out together, up to
+    ``frames_per_message`` per send, so a long utterance costs one message
+    per 100 ms instead of one per 20 ms; a lone frame is never held back
+    waiting for company. Marks queued with ``put_mark`` are passed to
+    ``send_mark`` right after the audio ahead of them.
+    """
+
+    def __init__(self, send, frame_ms=20, max_frames=1500,
+                 prefill_frames=PLAYOUT_PREFILL_FRAMES, max_lag_ms=PLAYOUT_MAX_LAG_MS,
+                 frames_per_message=PLAYOUT_FRAMES_PER_MESSAGE, send_mark=None):
+        self.send = send  # async callable taking μ-law audio (one or more frames)
+        self.send_mark = send_mark  # async callable taking a mark name
+        self.frames_per_message = max(frames_per_message, 1)
+        self.frame_s = frame_ms / 1000
+        self.prefill_s = max(prefill_frames, 1) * self.frame_s
+        self.max_lag_s = max_lag_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_frames)
+        self.generation = 0
+        self.marks_queued = 0
+        self.messages_sent = 0
+        self.frames_queued = 0  # position after the last queued frame; dropped frames give theirs back
+        self.frames_sent = 0
+        self.frames_flushed = 0
+        self.resyncs = 0
+
+    @property
+    def depth(self):
+        """Number of frames waiting to be played"""
+        return self.queue.qsize() - self.marks_queued
+
+    @property
+    def lead_frames(self):
+        """Frames sent ahead of real time (the prefill burst), so not yet played"""
+        return round(self.prefill_s / self.frame_s)
+
+    @property
+    def queued_ms(self):
+        return int(self.depth * self.frame_s * 1000)
+
+    async def put(self, frame):
+        """Queue a frame, waiting while the queue is full"""
+        await self.queue.put(frame)
+        self.frames_queued += 1
+
+    async def put_mark(self, name):
+        """Queue a mark behind the frames already queued"""
+        self.marks_queued += 1
+        await self.queue.put(PlayoutMark(name))
+
+    def _take(self):
+        item = self.queue.get_nowait()
+        if isinstance(item, PlayoutMark):
+            self.marks_queued -= 1
+        return item
+
+    def flush(self):
+        """Drop every queued frame at once; returns how many were dropped"""
+        self.generation += 1
+        dropped = 0
+        while True:
+            try:
+                if not isinstance(self._take(), PlayoutMark):
+                    dropped += 1
+            except asyncio.QueueEmpty:
+                break
+        self.frames_flushed += dropped
+        self.frames_queued -= dropped
+        return dropped
+
+    async def run(self):
+        """Send queued frames until cancelled"""
+        loop = asyncio.get_running_loop()
+        next_due = None
+        while True:
+            idle = self.queue.empty()
+            item = await self.queue.get()
+            generation = self.generation
+            if isinstance(item, PlayoutMark):
+                self.marks_queued -= 1
+                await self._send_mark(item)
+                continue
+
+            # Pick up frames that are already waiting; stop at a mark so it follows its audio
+            frames, mark = [item], None
+            while len(frames) < self.frames_per_message:
+                try:
+                    item = self._take()
+                except asyncio.QueueEmpty:
+                    break
+                if isinstance(item, PlayoutMark):
+                    mark = item
+                    break
+                frames.append(item)
+
+            now = loop.time()  # monotonic
+            if next_due is None or now - next_due > self.max_lag_s:
+                # New talk spurt, or sending stalled: restart the clock with a prefill
+                if next_due is not None and not idle:
+                    self.resyncs += 1
+                # The first prefill frames are already due, so they go out back-to-back
+                next_due = now - self.prefill_s + self.frame_s
+            elif next_due > now:
+                await asyncio.sleep(next_due - now)
+                if generation != self.generation:
+                    # Flushed while waiting: these frames are dropped too
+                    self.frames_flushed += len(frames)
+                    self.frames_queued -= len(frames)
+                    continue
+
+            await self.send(frames[0] if len(frames) == 1 else b"".join(frames))
+            self.messages_sent += 1
+            self.frames_sent += len(frames)
+            next_due += len(frames) * self.frame_s
+            if mark is not None:
+                await self._send_mark(mark)
+
+    async def _send_mark(self, mark):
+        if self.send_mark is not None:
+            await self.send_mark(mark.name)
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "sent": self.frames_sent,
+            "messages": self.messages_sent,
+            "flushed": self.frames_flushed,
+            "resyncs": self.resyncs,
+        }
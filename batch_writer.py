@@ -0,0 +1,90 @@
+"""
+Batching writer thread - queued records appended to a file or database off the event loop
+"""
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class BatchWriter(threading.Thread):
+    """Buffers queued items and hands them to ``write`` in batches.
+
+    A batch goes out once its oldest item has waited ``flush_interval``
+    seconds or ``batch_size`` items are pending. ``write(items)`` does the
+    I/O and raises on failure; ``close()`` releases whatever it holds and is
+    called after a failure (so the next attempt starts fresh) and at stop.
+    Failed items are retried every interval together with newer ones; at
+    most ``max_pending`` are kept, older ones are dropped and counted. The
+    thread itself never dies on an I/O error.
+    """
+
+    def __init__(self, name, write, close=None, flush_interval=0.5, batch_size=256, max_pending=10000):
+        super().__init__(name=name, daemon=True)
+        self.write_batch = write
+        self.close_sink = close
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max(max_pending, batch_size)
+        self.items = queue.SimpleQueue()
+        self.errors = 0
+        self.dropped = 0
+
+    def write(self, item):
+        self.items.put(item)
+
+    def stop(self):
+        self.items.put(_STOP)
+        self.join(timeout=5)
+
+    def run(self):
+        pending = []
+        deadline = None  # when the oldest pending item has waited flush_interval
+        failed = False   # after a failed write, retry on the interval rather than per item
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.items.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            full = len(pending) >= self.batch_size and not failed
+            if pending and (stopping or full or time.monotonic() >= deadline):
+                pending = self._flush(pending)
+                failed = bool(pending)
+                deadline = time.monotonic() + self.flush_interval if pending else None
+        self._close()
+
+    def _flush(self, pending):
+        """Write pending items; returns the ones still to be written"""
+        try:
+            self.write_batch(pending)
+            return []
+        except Exception as e:
+            self.errors += 1
+            self._close()
+            overflow = len(pending) - self.max_pending
+            if overflow > 0:
+                del pending[:overflow]
+                self.dropped += overflow
+            logger.warning(f"{self.name}: write failed ({e}); {len(pending)} items kept for retry, "
+                           f"{self.dropped} dropped so far")
+            return pending
+
+    def _close(self):
+        if self.close_sink is None:
+            return
+        try:
+            self.close_sink()
+        except Exception as e:
+            logger.warning(f"{self.name}: close failed ({e})")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+audio_codec micro-benchmark against the audioop baseline
+
+Usage: python bench_codec.py [calls] [frames]
+"""
+import sys
+import time
+import numpy as np
+import audio_codec as codec
+
+try:
+    import audioop  # removed in Python 3.13
+except ImportError:
+    audioop = None
+
+FRAME_ULAW = 160   # 20 ms at 8 kHz
+FRAME_PCM16K = 640 # 20 ms at 16 kHz, bytes
+
+def timed(label, fn, frames):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<44} {elapsed * 1e6 / frames:8.2f} µs/frame")
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    total = calls * frames
+    rng = np.random.default_rng(0)
+    ulaw = [rng.integers(0, 256, FRAME_ULAW, dtype=np.uint8).tobytes() for _ in range(calls)]
+    pcm = [rng.integers(-8000, 8000, FRAME_PCM16K // 2, dtype=np.int16).tobytes() for _ in range(calls)]
+
+    print(f"{calls} calls x {frames} frames of 20 ms")
+
+    if audioop is not None:
+        def audioop_inbound():
+            states = [None] * calls
+            for _ in range(frames):
+                for i in range(calls):
+                    pcm8k = audioop.ulaw2lin(ulaw[i], 2)
+                    _, states[i] = audioop.ratecv(pcm8k, 2, 1, 8000, 16000, states[i])
+
+        def audioop_outbound():
+            states = [None] * calls
+            for _ in range(frames):
+                for i in range(calls):
+                    pcm8k, states[i] = audioop.ratecv(pcm[i], 2, 1, 16000, 8000, states[i])
+                    audioop.lin2ulaw(pcm8k, 2)
+
+        timed("audioop  inbound  (ulaw2lin + ratecv up)", audioop_inbound, total)
+        timed("audioop  outbound (ratecv down + lin2ulaw)", audioop_outbound, total)
+    else:
+        print("audioop not available, skipping baseline")
+
+    def codec_inbound():
+        states = [codec.Upsampler() for _ in range(calls)]
+        for _ in range(frames):
+            for i in range(calls):
+                states[i].process(codec.ulaw_decode(ulaw[i])).tobytes()
+
+    def codec_outbound():
+        states = [codec.Downsampler() for _ in range(calls)]
+        for _ in range(frames):
+            for i in range(calls):
+                codec.ulaw_encode(states[i].process(np.frombuffer(pcm[i], dtype="<i2")))
+
+    def codec_inbound_batch():
+        states = [codec.Upsampler() for _ in range(calls)]
+        for _ in range(frames):
+            codec.ulaw8k_to_pcm16_16k_batch(states, ulaw)
+
+    def codec_outbound_batch():
+        states = [codec.Downsampler() for _ in range(calls)]
+        for _ in range(frames):
+            codec.pcm16_16k_to_ulaw8k_batch(states, pcm)
+
+    timed("codec    inbound  per frame", codec_inbound, total)
+    timed("codec    outbound per frame", codec_outbound, total)
+    timed("codec    inbound  batched across calls", codec_inbound_batch, total)
+    timed("codec    outbound batched across calls", codec_outbound_batch, total)
+
+if __name__ == "__main__":
+    main()
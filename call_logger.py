@@ -0,0 +1,110 @@
+"""
+Non-blocking call event logging - a background thread owns all log file I/O
+"""
+import os
+import queue
+import atexit
+import logging
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from batch_writer import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+CALLSLOG_PATH = os.getenv("CALLSLOG_PATH", "callslog")
+CALLSLOG_FLUSH_INTERVAL = float(os.getenv("CALLSLOG_FLUSH_INTERVAL", "0.5"))  # seconds
+CALLSLOG_BATCH_SIZE = int(os.getenv("CALLSLOG_BATCH_SIZE", "256"))            # lines per write
+CALLSLOG_MAX_PENDING_BATCHES = int(os.getenv("CALLSLOG_MAX_PENDING_BATCHES", "40"))  # kept while writes fail
+
+# Per-frame events (50/s per call) are sampled: 1 in N is written, 0 disables them
+HIGH_FREQUENCY_EVENTS = {
+    "MEDIA_RECEIVED", "STT_AUDIO_SENT", "TWILIO_AUDIO_SENT", "TWILIO_EVENT", "STT_MESSAGE",
+}
+HIGH_FREQUENCY_SAMPLE_EVERY = int(os.getenv("CALLSLOG_SAMPLE_EVERY", "50"))
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class CallLogFile:
+    """The call log, opened on first write and reopened after an error"""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+
+    def write(self, lines):
+        if self.f is None:
+            self.f = open(self.path, 'a', encoding='utf-8')
+        self.f.write('\n'.join(lines) + '\n')
+        self.f.flush()
+
+    def close(self):
+        f, self.f = self.f, None
+        if f is not None:
+            f.close()
+
+_writer = None
+_listener = None
+_event_counts = {}
+
+def setup_logging(level=logging.INFO, log_file='call_system.log'):
+    """Route the root logger and the call log through background writer threads"""
+    global _writer, _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    targets = [logging.FileHandler(log_file), logging.StreamHandler()]
+    for handler in targets:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    # Records are queued as bare messages; the target handlers apply LOG_FORMAT
+    logging.basicConfig(level=level, format="%(message)s", handlers=[QueueHandler(log_queue)])
+    _listener = QueueListener(log_queue, *targets, respect_handler_level=True)
+    _listener.start()
+
+    sink = CallLogFile(CALLSLOG_PATH)
+    _writer = BatchWriter("callslog-writer", sink.write, sink.close, flush_interval=CALLSLOG_FLUSH_INTERVAL,
+                          batch_size=CALLSLOG_BATCH_SIZE,
+                          max_pending=CALLSLOG_BATCH_SIZE * CALLSLOG_MAX_PENDING_BATCHES)
+    _writer.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flush and stop the writer threads"""
+    global _writer, _listener
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _sampled_out(event_type):
+    """True when a high-frequency event should be skipped"""
+    if event_type not in HIGH_FREQUENCY_EVENTS:
+        return False
+    if HIGH_FREQUENCY_SAMPLE_EVERY <= 0:
+        return True
+    count = _event_counts.get(event_type, 0)
+    _event_counts[event_type] = count + 1
+    return count % HIGH_FREQUENCY_SAMPLE_EVERY != 0
+
+def log_call_event(event_type, details, call_sid=None):
+    """Log call events with timestamps to callslog"""
+    if _sampled_out(event_type):
+        return
+
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    log_entry = f"[{timestamp}] {event_type}: {details}"
+    if call_sid:
+        log_entry += f" (Call SID: {call_sid})"
+
+    if _writer is not None:
+        _writer.write(log_entry)
+
+    # Per-frame events stay out of the main log unless DEBUG is enabled
+    if event_type in HIGH_FREQUENCY_EVENTS:
+        logger.debug(log_entry)
+    else:
+        logger.info(log_entry)
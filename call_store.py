@@ -0,0 +1,135 @@
+"""
+Call state registry - in-memory index by Call SID / stream SID, backed by an append-only SQLite log
+"""
+import os
+import json
+import time
+import atexit
+import sqlite3
+import logging
+from batch_writer import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+CALLSTORE_PATH = os.getenv("CALLSTORE_PATH", "calls.db")
+CALLSTORE_REPLAY_HOURS = float(os.getenv("CALLSTORE_REPLAY_HOURS", "24"))  # history loaded at startup
+CALLSTORE_FLUSH_INTERVAL = float(os.getenv("CALLSTORE_FLUSH_INTERVAL", "0.5"))
+CALLSTORE_MAX_PENDING = int(os.getenv("CALLSTORE_MAX_PENDING", "50000"))  # events kept while writes fail
+
+FINAL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+
+class CallEventTable:
+    """The call_events table, connected from the writer thread and reconnected after an error"""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+
+    def write(self, rows):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path)
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO call_events (ts, call_sid, stream_sid, event, fields) VALUES (?, ?, ?, ?, ?)",
+                rows)
+
+    def close(self):
+        db, self.db = self.db, None
+        if db is not None:
+            db.close()
+
+class CallStore:
+    """Current state of every recent call, queryable in O(1).
+
+    Each update merges fields into the call's record in memory and appends
+    one event row to SQLite through a writer thread, so nothing on the hot
+    path waits on disk. At startup the last CALLSTORE_REPLAY_HOURS of events
+    are replayed to rebuild the index.
+    """
+
+    def __init__(self, path=CALLSTORE_PATH, replay_hours=CALLSTORE_REPLAY_HOURS):
+        self.path = path
+        self.max_age_s = replay_hours * 3600
+        self.updates = 0
+        self.calls = {}      # call_sid -> record
+        self.by_stream = {}  # stream_sid -> call_sid
+        self._init_db(replay_hours)
+        table = CallEventTable(path)
+        self.writer = BatchWriter("callstore-writer", table.write, table.close,
+                                  flush_interval=CALLSTORE_FLUSH_INTERVAL, max_pending=CALLSTORE_MAX_PENDING)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def _init_db(self, replay_hours):
+        db = sqlite3.connect(self.path)
+        try:
+            with db:
+                db.execute("""
+                    CREATE TABLE IF NOT EXISTS call_events (
+                        ts REAL NOT NULL,
+                        call_sid TEXT NOT NULL,
+                        stream_sid TEXT,
+                        event TEXT NOT NULL,
+                        fields TEXT NOT NULL
+                    )""")
+                db.execute("CREATE INDEX IF NOT EXISTS call_events_sid ON call_events (call_sid)")
+            rows = db.execute(
+                "SELECT ts, call_sid, stream_sid, event, fields FROM call_events WHERE ts >= ? ORDER BY rowid",
+                (time.time() - replay_hours * 3600,)).fetchall()
+        finally:
+            db.close()
+        for ts, call_sid, stream_sid, event, fields in rows:
+            self._apply(ts, call_sid, stream_sid, event, json.loads(fields))
+        if rows:
+            logger.info(f"Call store: replayed {len(rows)} events for {len(self.calls)} calls")
+
+    def _apply(self, ts, call_sid, stream_sid, event, fields):
+        record = self.calls.get(call_sid)
+        if record is None:
+            record = self.calls[call_sid] = {"call_sid": call_sid, "created": ts}
+        if stream_sid:
+            record["stream_sid"] = stream_sid
+            self.by_stream[stream_sid] = call_sid
+        record.update(fields)
+        record["last_event"] = event
+        record["updated"] = ts
+        return record
+
+    def update(self, call_sid, event, stream_sid=None, **fields):
+        """Record an event for a call and merge its fields into the call's state"""
+        if not call_sid:
+            return None
+        ts = time.time()
+        record = self._apply(ts, call_sid, stream_sid, event, fields)
+        self.writer.write((ts, call_sid, stream_sid, event, json.dumps(fields, ensure_ascii=False, default=str)))
+        self.updates += 1
+        if self.updates % 1000 == 0:
+            self.prune(ts)
+        return record
+
+    def prune(self, now=None):
+        """Forget finished calls older than the replay window (they stay in SQLite)"""
+        cutoff = (now or time.time()) - self.max_age_s
+        for call_sid, record in list(self.calls.items()):
+            if record.get("status") in FINAL_STATUSES and record["updated"] < cutoff:
+                del self.calls[call_sid]
+                self.by_stream.pop(record.get("stream_sid"), None)
+
+    def get(self, call_sid):
+        return self.calls.get(call_sid)
+
+    def get_by_stream(self, stream_sid):
+        call_sid = self.by_stream.get(stream_sid)
+        return self.calls.get(call_sid) if call_sid else None
+
+    def find(self, sid):
+        """Look a call up by either its Call SID or its stream SID"""
+        return self.get(sid) or self.get_by_stream(sid)
+
+    def active(self):
+        """Calls that have not reached a final status"""
+        return [r for r in self.calls.values() if r.get("status") not in FINAL_STATUSES]
+
+    def close(self):
+        if self.writer.is_alive():
+            self.writer.stop()
@@ -0,0 +1,333 @@
+"""
+Outbound campaign dialer - bulk calls under CPS and concurrency caps, resumable via SQLite
+
+Usage:
+    python campaign.py numbers.csv --name bakim-2026-10 --cps 1 --max-concurrent 10
+"""
+import os
+import csv
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import argparse
+import threading
+from urllib.parse import urlencode
+from call_logger import log_call_event
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGN_DB_PATH = os.getenv("CAMPAIGN_DB_PATH", "campaigns.db")
+CAMPAIGN_CPS = float(os.getenv("CAMPAIGN_CPS", "1"))                      # new calls per second
+CAMPAIGN_MAX_CONCURRENT = int(os.getenv("CAMPAIGN_MAX_CONCURRENT", "10"))  # calls up at once
+CAMPAIGN_MAX_ATTEMPTS = int(os.getenv("CAMPAIGN_MAX_ATTEMPTS", "3"))
+CAMPAIGN_RETRY_BASE_S = float(os.getenv("CAMPAIGN_RETRY_BASE_S", "300"))  # doubles per attempt
+CAMPAIGN_POLL_INTERVAL_S = float(os.getenv("CAMPAIGN_POLL_INTERVAL_S", "5"))
+
+RETRY_OUTCOMES = {"busy", "no-answer"}
+FINAL_CALL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+NUMBER_FIELDS = ("to", "to_number", "phone")
+
+def load_rows(path):
+    """Read a CSV or JSONL contact list into ``{"to": ..., "variables": {...}}`` rows.
+
+    The number comes from a ``to``/``to_number``/``phone`` field. JSONL rows may
+    carry their variables under ``retell_llm_dynamic_variables``; otherwise every
+    other non-empty field is a variable.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = list(csv.DictReader(f))
+    return [parse_row(record) for record in records]
+
+def parse_row(record):
+    if not isinstance(record, dict):
+        raise ValueError(f"Row must be an object: {record!r}")
+    number = next((record[k] for k in NUMBER_FIELDS if record.get(k)), None)
+    if not number:
+        raise ValueError(f"Row has no phone number: {record}")
+    variables = record.get("retell_llm_dynamic_variables")
+    if variables is None:
+        variables = {k: v for k, v in record.items() if k not in NUMBER_FIELDS and v not in (None, "")}
+    elif isinstance(variables, str):
+        # A CSV column holds the variables as JSON text
+        try:
+            variables = json.loads(variables) if variables.strip() else {}
+        except json.JSONDecodeError:
+            raise ValueError(f"retell_llm_dynamic_variables is not valid JSON: {variables!r}")
+    if not isinstance(variables, dict):
+        raise ValueError(f"retell_llm_dynamic_variables must be an object: {variables!r}")
+    return {"to": str(number).strip(), "variables": {k: str(v) for k, v in variables.items()}}
+
+class TokenBucket:
+    """Async rate limiter: ``rate`` tokens per second, at most ``burst`` saved up"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class CampaignStore:
+    """SQLite progress table; one row per contact per campaign.
+
+    Rows move pending -> dialing -> completed | failed, or back to retry with
+    a next-attempt time. A number appears once per campaign: loading the same
+    list again is a no-op, so a restart picks up where the last run stopped,
+    and a list split over several loads appends to the campaign.
+    """
+
+    def __init__(self, path=CAMPAIGN_DB_PATH):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS campaign_calls (
+                    campaign TEXT NOT NULL,
+                    row INTEGER NOT NULL,
+                    to_number TEXT NOT NULL,
+                    variables TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL DEFAULT 0,
+                    call_sid TEXT,
+                    outcome TEXT,
+                    updated REAL,
+                    PRIMARY KEY (campaign, row)
+                )""")
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS campaign_calls_number ON campaign_calls (campaign, to_number)")
+
+    def add_rows(self, campaign, rows):
+        """Append rows whose number the campaign does not have yet; returns how many were new"""
+        with self.lock, self.db:
+            next_row = self.db.execute(
+                "SELECT COALESCE(MAX(row) + 1, 0) FROM campaign_calls WHERE campaign = ?", (campaign,)).fetchone()[0]
+            added = 0
+            for row in rows:
+                cursor = self.db.execute(
+                    "INSERT INTO campaign_calls (campaign, row, to_number, variables, updated) "
+                    "SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS "
+                    "(SELECT 1 FROM campaign_calls WHERE campaign = ? AND to_number = ?)",
+                    (campaign, next_row + added, row["to"], json.dumps(row["variables"], ensure_ascii=False), time.time(),
+                     campaign, row["to"]))
+                added += cursor.rowcount
+            return added
+
+    def recover(self, campaign):
+        """After a restart: rows that never got a Call SID are dialed again; the rest are returned to watch"""
+        with self.lock, self.db:
+            self.db.execute(
+                "UPDATE campaign_calls SET status = 'pending' WHERE campaign = ? AND status = 'dialing' AND call_sid IS NULL",
+                (campaign,))
+            return self.db.execute(
+                "SELECT * FROM campaign_calls WHERE campaign = ? AND status = 'dialing'", (campaign,)).fetchall()
+
+    def due(self, campaign, limit):
+        with self.lock:
+            return self.db.execute(
+                "SELECT * FROM campaign_calls WHERE campaign = ? AND status IN ('pending', 'retry') AND next_attempt <= ? "
+                "ORDER BY next_attempt, row LIMIT ?", (campaign, time.time(), limit)).fetchall()
+
+    def next_due_in(self, campaign):
+        """Seconds until the next waiting row is due, or None when nothing is left to dial"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT MIN(next_attempt) FROM campaign_calls WHERE campaign = ? AND status IN ('pending', 'retry')",
+                (campaign,)).fetchone()
+        return None if row[0] is None else max(row[0] - time.time(), 0)
+
+    def update(self, campaign, row, **fields):
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock, self.db:
+            self.db.execute(f"UPDATE campaign_calls SET {columns} WHERE campaign = ? AND row = ?",
+                            (*fields.values(), campaign, row))
+
+    def progress(self, campaign):
+        """Row counts by status"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT status, COUNT(*) FROM campaign_calls WHERE campaign = ? GROUP BY status", (campaign,)).fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class CampaignDialer:
+    """Dials a stored campaign until every row is completed or out of attempts.
+
+    New calls are started under a calls-per-second token bucket and at most
+    ``max_concurrent`` calls are up at once. Pass ``bucket`` and ``slots`` to
+    share both caps between dialers running at the same time. Each call's outcome is polled from
+    the call store when a status webhook feeds one, else from the Twilio REST
+    API; busy and no-answer are retried with exponential backoff.
+    Dynamic variables ride on the answer URL as query parameters.
+    """
+
+    def __init__(self, twilio, from_number, answer_url, store,
+                 cps=CAMPAIGN_CPS, max_concurrent=CAMPAIGN_MAX_CONCURRENT,
+                 max_attempts=CAMPAIGN_MAX_ATTEMPTS, retry_base_s=CAMPAIGN_RETRY_BASE_S,
+                 poll_interval_s=CAMPAIGN_POLL_INTERVAL_S, status_callback=None, call_store=None,
+                 on_call_created=None, bucket=None, slots=None):
+        self.twilio = twilio  # twilio_async.AsyncTwilioClient
+        self.from_number = from_number
+        self.answer_url = answer_url
+        self.store = store
+        self.bucket = bucket or TokenBucket(cps)
+        self.slots = slots or asyncio.Semaphore(max_concurrent)
+        self.max_attempts = max_attempts
+        self.retry_base_s = retry_base_s
+        self.poll_interval_s = poll_interval_s
+        self.status_callback = status_callback
+        self.call_store = call_store  # call_store.CallStore fed by the status webhook
+        self.on_call_created = on_call_created  # e.g. start pre-warming the call's sessions
+        self.active = set()
+
+    def call_url(self, variables):
+        return f"{self.answer_url}?{urlencode(variables)}" if variables else self.answer_url
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.active.add(task)
+        task.add_done_callback(self.active.discard)
+
+    async def run(self, campaign):
+        """Dial every due row; returns the final progress counts"""
+        for row in await asyncio.to_thread(self.store.recover, campaign):
+            await self.slots.acquire()
+            self._spawn(self._follow(campaign, row, row["call_sid"]))
+        log_call_event("CAMPAIGN_STARTED", f"Campaign {campaign}: {self.store.progress(campaign)}")
+
+        try:
+            while True:
+                rows = await asyncio.to_thread(self.store.due, campaign, 50)
+                if not rows:
+                    wait = await asyncio.to_thread(self.store.next_due_in, campaign)
+                    if wait is None and not self.active:
+                        break
+                    await asyncio.sleep(min(wait if wait is not None else 1, 1))
+                    continue
+                for row in rows:
+                    await self.slots.acquire()
+                    await self.bucket.acquire()
+                    await asyncio.to_thread(self.store.update, campaign, row["row"], status="dialing",
+                                            attempts=row["attempts"] + 1, call_sid=None)
+                    self._spawn(self._dial(campaign, row))
+        finally:
+            for task in list(self.active):
+                task.cancel()  # rows stay 'dialing' and are picked up by the next run
+            await asyncio.gather(*self.active, return_exceptions=True)
+
+        progress = self.store.progress(campaign)
+        log_call_event("CAMPAIGN_FINISHED", f"Campaign {campaign}: {progress}")
+        return progress
+
+    async def _dial(self, campaign, row):
+        extra = {}
+        if self.status_callback:
+            extra = {"status_callback": self.status_callback,
+                     "status_callback_event": ["initiated", "ringing", "answered", "completed"]}
+        try:
+            call = await self.twilio.create_call(
+                to=row["to_number"],
+                from_=self.from_number,
+                url=self.call_url(json.loads(row["variables"])),
+                **extra,
+            )
+        except Exception as e:
+            self.slots.release()
+            log_call_event("CAMPAIGN_DIAL_ERROR", f"Campaign {campaign} row {row['row']}: {str(e)}")
+            await self._settle(campaign, row["row"], row["attempts"] + 1, "failed")
+            return
+        await asyncio.to_thread(self.store.update, campaign, row["row"], call_sid=call.sid)
+        if self.call_store is not None:
+            self.call_store.update(call.sid, "created", status=call.status, to=row["to_number"], campaign=campaign)
+        if self.on_call_created is not None:
+            self.on_call_created(call.sid)
+        log_call_event("CAMPAIGN_CALL_CREATED", f"Campaign {campaign} row {row['row']} -> {row['to_number']}", call.sid)
+        await self._follow(campaign, row, call.sid, attempts=row["attempts"] + 1)
+
+    async def _follow(self, campaign, row, call_sid, attempts=None):
+        """Wait for the call to end, then record the outcome; holds a concurrency slot"""
+        try:
+            outcome = await self.wait_for_outcome(call_sid)
+        finally:
+            self.slots.release()
+        await self._settle(campaign, row["row"], attempts or row["attempts"], outcome)
+
+    async def wait_for_outcome(self, call_sid):
+        polls = 0
+        while True:
+            record = self.call_store.get(call_sid) if self.call_store is not None else None
+            if record is not None and record.get("status") in FINAL_CALL_STATUSES:
+                return record["status"]
+            polls += 1
+            # With webhook updates the REST API is only a slow backstop for missed callbacks
+            if record is not None and polls % 12:
+                await asyncio.sleep(self.poll_interval_s)
+                continue
+            try:
+                status = (await self.twilio.fetch_call(call_sid)).status
+                if status in FINAL_CALL_STATUSES:
+                    return status
+            except Exception as e:
+                logger.warning(f"Campaign status poll failed for {call_sid}: {e}")
+            await asyncio.sleep(self.poll_interval_s)
+
+    async def _settle(self, campaign, row, attempts, outcome):
+        if outcome in RETRY_OUTCOMES and attempts < self.max_attempts:
+            delay = self.retry_base_s * 2 ** (attempts - 1)
+            fields = {"status": "retry", "next_attempt": time.time() + delay}
+        else:
+            fields = {"status": "completed" if outcome == "completed" else "failed"}
+        await asyncio.to_thread(self.store.update, campaign, row, outcome=outcome, **fields)
+        log_call_event("CAMPAIGN_CALL_OUTCOME", f"Campaign {campaign} row {row}: {outcome} -> {fields['status']}")
+
+async def main():
+    from dotenv import load_dotenv
+    from call_logger import setup_logging
+    from twilio_async import AsyncTwilioClient
+
+    parser = argparse.ArgumentParser(description="Dial a contact list (CSV or JSONL)")
+    parser.add_argument("path", help="contact list; .jsonl or .csv")
+    parser.add_argument("--name", help="campaign name (default: file name); reuse it to resume")
+    parser.add_argument("--cps", type=float, default=CAMPAIGN_CPS)
+    parser.add_argument("--max-concurrent", type=int, default=CAMPAIGN_MAX_CONCURRENT)
+    parser.add_argument("--db", default=CAMPAIGN_DB_PATH)
+    args = parser.parse_args()
+
+    load_dotenv("config.env")
+    setup_logging()
+    name = args.name or os.path.splitext(os.path.basename(args.path))[0]
+    store = CampaignStore(args.db)
+    added = store.add_rows(name, load_rows(args.path))
+    print(f"Campaign {name}: {added} new rows, {store.progress(name)}")
+
+    twilio = AsyncTwilioClient(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+    dialer = CampaignDialer(twilio, os.getenv("TWILIO_PHONE_NUMBER"),
+                            f"https://{os.getenv('PUBLIC_HOST')}/answer", store,
+                            cps=args.cps, max_concurrent=args.max_concurrent)
+    try:
+        print(f"Campaign {name} done: {await dialer.run(name)}")
+    finally:
+        twilio.close()
+        store.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Per-call conversation memory - recent turns kept inside a token budget, older ones condensed
+"""
+import os
+from collections import deque
+from prompts import encode_message
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1200"))    # history sent with each request
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "200"))  # cap on the condensed part
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators per chat message
+
+SPEAKER_LABELS = {"user": "Müşteri", "assistant": "Asistan"}
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) so a turn costs no tokenizer pass"""
+    return len(text) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+class ConversationMemory:
+    """Turn history for one call, bounded by ``token_budget``.
+
+    Turns live in a deque with a running token total, so adding a turn and
+    evicting old ones is O(1). Evicted turns are folded into a short
+    extractive summary (newest kept, oldest trimmed first) that goes out as
+    one system message ahead of the remaining turns. Each turn is JSON-encoded
+    once when added, so building a request never re-serializes history.
+    """
+
+    def __init__(self, token_budget=MEMORY_TOKEN_BUDGET, summary_tokens=MEMORY_SUMMARY_TOKENS):
+        self.token_budget = token_budget
+        self.summary_chars = summary_tokens * 4
+        self.turns = deque()  # (message, tokens, encoded message)
+        self.tokens = 0
+        self.summary = ""
+        self._summary_encoded = None
+        self.evicted = 0
+
+    def add(self, role, content):
+        content = content.strip()
+        if not content:
+            return
+        tokens = estimate_tokens(content)
+        message = {"role": role, "content": content}
+        self.turns.append((message, tokens, encode_message(message)))
+        self.tokens += tokens
+        while self.tokens > self.token_budget and len(self.turns) > 1:
+            message, tokens, _ = self.turns.popleft()
+            self.tokens -= tokens
+            self.evicted += 1
+            self._condense(message)
+
+    def add_exchange(self, user_text, assistant_text):
+        """Record one caller utterance and what the bot actually said back"""
+        self.add("user", user_text)
+        self.add("assistant", assistant_text)
+
+    def replace_last(self, role, content):
+        """Rewrite the newest turn if it is ``role``'s (dropped when content is empty)"""
+        if not self.turns or self.turns[-1][0]["role"] != role:
+            return
+        _, tokens, _ = self.turns.pop()
+        self.tokens -= tokens
+        self.add(role, content)
+
+    def _condense(self, message):
+        line = f"{SPEAKER_LABELS.get(message['role'], message['role'])}: {message['content']}"
+        summary = f"{self.summary}\n{line}" if self.summary else line
+        if len(summary) > self.summary_chars:
+            summary = "…" + summary[-self.summary_chars:]
+        self.summary = summary
+        self._summary_encoded = encode_message(self._summary_message())
+
+    def _summary_message(self):
+        return {"role": "system", "content": f"Görüşmenin önceki kısmı (özet):\n{self.summary}"}
+
+    def messages(self):
+        """History messages to place after the system prompt"""
+        history = [message for message, _, _ in self.turns]
+        if self.summary:
+            history.insert(0, self._summary_message())
+        return history
+
+    def encoded(self):
+        """The same history as pre-encoded JSON messages"""
+        history = [encoded for _, _, encoded in self.turns]
+        if self._summary_encoded:
+            history.insert(0, self._summary_encoded)
+        return history
+
+    def stats(self):
+        return {"turns": len(self.turns), "tokens": self.tokens, "evicted": self.evicted}
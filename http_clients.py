@@ -0,0 +1,89 @@
+"""
+Shared HTTP clients - one pooled, keep-alive httpx client per upstream API
+"""
+import os
+import asyncio
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Read timeouts (seconds) per upstream; override with HTTP_TIMEOUT_<NAME>
+UPSTREAM_TIMEOUTS = {
+    "openai": 30,
+    "azure_tts": 60,
+    "retell": 60,
+}
+
+def _env_number(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+class HttpClientRegistry:
+    """Application-lifetime registry of pooled ``httpx.AsyncClient`` objects.
+
+    Clients are created on first use (or eagerly via ``start``) and reused for
+    every request, so each conversational turn rides on warm TCP/TLS
+    connections instead of paying a new handshake.
+    """
+
+    def __init__(self, max_connections=None, max_keepalive=None, keepalive_expiry=None,
+                 connect_timeout=None, http2=None):
+        self.limits = httpx.Limits(
+            max_connections=int(max_connections or _env_number("HTTP_MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(max_keepalive or _env_number("HTTP_MAX_KEEPALIVE", 20)),
+            keepalive_expiry=keepalive_expiry or _env_number("HTTP_KEEPALIVE_EXPIRY", 30),
+        )
+        self.connect_timeout = connect_timeout or _env_number("HTTP_CONNECT_TIMEOUT", 5)
+        if http2 is None:
+            http2 = os.getenv("HTTP_DISABLE_HTTP2") != "1"
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._clients = {}
+
+    def _timeout(self, name):
+        read = _env_number(f"HTTP_TIMEOUT_{name.upper()}", UPSTREAM_TIMEOUTS.get(name, 30))
+        return httpx.Timeout(read, connect=self.connect_timeout)
+
+    def get(self, name) -> httpx.AsyncClient:
+        """Return the shared client for an upstream, creating it if needed"""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(http2=self.http2, limits=self.limits, timeout=self._timeout(name))
+            self._clients[name] = client
+            logger.info(f"HTTP client pool created for {name} (http2={self.http2})")
+        return client
+
+    async def start(self, names=None):
+        """Create the clients up front, e.g. from the FastAPI lifespan hook"""
+        for name in names or UPSTREAM_TIMEOUTS:
+            self.get(name)
+
+    async def aclose(self):
+        """Close every pooled connection"""
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"HTTP client close failed: {e}")
+
+registry = HttpClientRegistry()
+
+def get_client(name) -> httpx.AsyncClient:
+    """Shared client for ``name`` from the process-wide registry"""
+    return registry.get(name)
+
+def run_with_clients(coro):
+    """``asyncio.run`` for scripts, closing the shared clients before the loop ends"""
+    async def _runner():
+        try:
+            return await coro
+        finally:
+            await registry.aclose()
+    return asyncio.run(_runner())
@@ -10,30 +10,37 @@ import json
 import base64
 import asyncio
 import time
+from collections import deque
 import logging
-from datetime import datetime
-from fastapi import FastAPI, Request, Response, WebSocket, HTTPException
-from twilio.rest import Client
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect, HTTPException
 from twilio.twiml.voice_response import VoiceResponse
 from twilio.request_validator import RequestValidator
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 import jwt
-import httpx
 import websockets
-import audioop
+import numpy as np
 from urllib.parse import quote_plus
+from http_clients import registry as http_clients, get_client
+from call_logger import setup_logging, log_call_event
+from tts_cache import TTSCache, cache_key
+from tts_formats import negotiate
+from audio_scheduler import OutboundAudioScheduler
+from audio_codec import Upsampler, Downsampler, ulaw_decode, ulaw_encode
+from transcoder import TranscodeEngine
+from twilio_media import MediaEnvelope, parse_media
+from twilio_async import AsyncTwilioClient
+from campaign import CampaignStore, CampaignDialer, TokenBucket, parse_row, CAMPAIGN_CPS, CAMPAIGN_MAX_CONCURRENT
+from call_store import CallStore
+from conversation_memory import ConversationMemory, estimate_tokens
+from prompts import UsageStats, get_template
+from speculation import Speculation, SpeculationStats, SPECULATION_STABLE_PARTIALS, SPECULATION_MIN_WORDS, normalize
+from prewarm import CallPrewarmer
+from stt_pool import SttSessionPool, PooledSession
 
-# Configure comprehensive logging with timestamps
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('call_system.log'),
-        logging.FileHandler('callslog'),  # New detailed call log
-        logging.StreamHandler()
-    ]
-)
+# Configure logging; file writes happen on background threads, never in the event loop
+setup_logging(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Environment variables
@@ -53,10 +60,14 @@ print(f"AUTH_TOKEN: {AUTH_TOKEN}")
 print(f"TWILIO_NUMBER: {TWILIO_NUMBER}")
 print(f"PUBLIC_HOST: {PUBLIC_HOST}")
 
-# Initialize Twilio client
-twilio = Client(ACCOUNT_SID, AUTH_TOKEN)
+# Initialize Twilio client (REST calls run in a worker pool, off the event loop)
+twilio = AsyncTwilioClient(ACCOUNT_SID, AUTH_TOKEN)
 validator = RequestValidator(AUTH_TOKEN)
 
+# Call state by Call SID / stream SID, kept in memory and appended to SQLite
+call_store = CallStore()
+STATUS_CALLBACK_EVENTS = ["initiated", "ringing", "answered", "completed"]
+
 # Log configuration
 logger.info(f"Loading with ACCOUNT_SID: {ACCOUNT_SID}")
 logger.info(f"Loading with AUTH_TOKEN: {AUTH_TOKEN}")
@@ -65,15 +76,42 @@ logger.info(f"Loading with TWILIO_NUMBER: {TWILIO_NUMBER}")
 if DISABLE_TWILIO_SIG:
     logger.info("Twilio signature validation disabled")
 
-def make_ws_token(ttl=300):
+def make_ws_token(ttl=300, call_sid=None):
     """Generate JWT token for WebSocket authentication"""
     payload = {
         "exp": int(time.time()) + ttl,
         "iss": "ai-voice",
         "scopes": ["ws"]
     }
+    if call_sid:
+        payload["call_sid"] = call_sid  # lets /stream claim the call's pre-warmed sessions
+    return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
+
+def make_operator_token(ttl=3600):
+    """Generate JWT token for operator endpoints (campaigns, call records)"""
+    payload = {
+        "exp": int(time.time()) + ttl,
+        "iss": "ai-voice",
+        "scopes": ["operator"]
+    }
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
+def require_operator(request: Request):
+    """Reject requests without a bearer JWT carrying the operator scope"""
+    if JWT_SECRET == "change-me":
+        # Anyone could mint a token with the default secret
+        raise HTTPException(503, "Operator endpoints are disabled until JWT_SECRET is set")
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        raise HTTPException(401, "Operator token required")
+    try:
+        decoded = jwt.decode(auth[len("Bearer "):], JWT_SECRET, algorithms=["HS256"])
+    except jwt.PyJWTError:
+        raise HTTPException(401, "Invalid operator token")
+    if "operator" not in decoded.get("scopes", []):
+        raise HTTPException(403, "Operator scope required")
+    return decoded
+
 async def verify_twilio_signature(request: Request, body: bytes):
     """Verify Twilio request signature"""
     if DISABLE_TWILIO_SIG:
@@ -107,56 +145,256 @@ def is_ending_response(text):
     text_lower = text.lower()
     return any(e in text_lower for e in endings)
 
+ENDING_FALLBACK = "Anladım. Başka bir konuda yardımcı olabilir miyim?"
+SHORT_FALLBACK = "Devam edebilirsiniz. Size nasıl yardımcı olabilirim?"
+MIN_RESPONSE_WORDS = 3
+
+class ResponseFilter:
+    """Incremental form of filter_response for responses that arrive in segments.
+
+    ``feed`` returns the segments that are safe to speak now and ``finish``
+    returns whatever is still held back. Segments are held until the response
+    reaches MIN_RESPONSE_WORDS, and an ending phrase replaces the rest of the
+    response with the continuation prompt.
+    """
+
+    def __init__(self):
+        self.held = []
+        self.spoken = []
+        self.done = False
+
+    @property
+    def text(self):
+        """Everything released for speaking so far"""
+        return " ".join(self.spoken)
+
+    def _release(self, segments):
+        self.spoken.extend(segments)
+        return segments
+
+    def feed(self, segment):
+        if self.done:
+            return []
+        if is_ending_response(segment):
+            logger.warning(f"⚠️ Response contains ending phrase: '{segment}'")
+            # Replace with continuation response
+            self.done = True
+            self.held = []
+            return self._release([ENDING_FALLBACK])
+        if self.spoken:
+            return self._release([segment])
+        
+        self.held.append(segment)
+        if len(" ".join(self.held).split()) >= MIN_RESPONSE_WORDS:
+            held, self.held = self.held, []
+            return self._release(held)
+        return []
+
+    def finish(self):
+        if self.done:
+            return []
+        self.done = True
+        # Ensure response is not too short or generic
+        if not self.spoken:
+            return self._release([SHORT_FALLBACK])
+        return []
+
 def filter_response(text):
     """Filter and improve the response to keep conversation going"""
-    if is_ending_response(text):
-        logger.warning(f"⚠️ Response contains ending phrase: '{text}'")
-        # Replace with continuation response
-        return "Anladım. Başka bir konuda yardımcı olabilir miyim?"
-    
-    # Ensure response is not too short or generic
-    if len(text.split()) < 3:
-        return "Devam edebilirsiniz. Size nasıl yardımcı olabilirim?"
-    
-    return text
+    response_filter = ResponseFilter()
+    response_filter.feed(text)
+    response_filter.finish()
+    return response_filter.text
+
+SENTENCE_ENDINGS = ".!?…"
+CLAUSE_ENDINGS = ",;:"
+CLAUSE_MIN_CHARS = int(os.getenv("CLAUSE_MIN_CHARS", "40"))
+
+class SentenceSegmenter:
+    """Cut a token stream into sentences (or long clauses) for early TTS"""
+
+    def __init__(self, clause_min_chars=CLAUSE_MIN_CHARS):
+        self.clause_min_chars = clause_min_chars
+        self.buffer = ""
+
+    def feed(self, delta):
+        """Add streamed text, returning every segment completed by it"""
+        self.buffer += delta
+        segments = []
+        start = 0
+        for i in range(len(self.buffer) - 1):
+            if not self.buffer[i + 1].isspace():
+                continue
+            char = self.buffer[i]
+            if char in SENTENCE_ENDINGS or (char in CLAUSE_ENDINGS and i - start >= self.clause_min_chars):
+                segment = self.buffer[start:i + 1].strip()
+                if segment:
+                    segments.append(segment)
+                start = i + 1
+        self.buffer = self.buffer[start:]
+        return segments
+
+    def flush(self):
+        """Return the trailing text once the stream has ended"""
+        segment, self.buffer = self.buffer.strip(), ""
+        return [segment] if segment else []
+
+# Voice activity detection on the caller's 8 kHz audio
+VAD_RMS = int(os.getenv("VAD_RMS", "500"))                      # minimum speech energy (PCM16 RMS)
+VAD_NOISE_RATIO = float(os.getenv("VAD_NOISE_RATIO", "3.0"))    # speech must be this far above the noise floor
+VAD_ZCR_MAX = float(os.getenv("VAD_ZCR_MAX", "0.35"))           # zero crossings per sample; above this is hiss
+VAD_START_FRAMES = int(os.getenv("VAD_START_FRAMES", "2"))      # voiced frames before speech starts
+VAD_HANGOVER_FRAMES = int(os.getenv("VAD_HANGOVER_FRAMES", "20"))  # 400 ms of quiet before speech ends
+
+class VoiceActivityDetector:
+    """Energy and zero-crossing speech detector with hangover, fed 20 ms int16 frames.
+
+    A frame is voiced when its RMS clears both VAD_RMS and VAD_NOISE_RATIO
+    times the running noise floor, and its zero-crossing rate is low enough
+    not to be broadband noise (unless it is very loud). ``process`` returns
+    "speech_start" or "speech_end" on state changes, otherwise None.
+    """
+
+    def __init__(self, min_rms=VAD_RMS, noise_ratio=VAD_NOISE_RATIO, zcr_max=VAD_ZCR_MAX,
+                 start_frames=VAD_START_FRAMES, hangover_frames=VAD_HANGOVER_FRAMES):
+        self.min_rms = min_rms
+        self.noise_ratio = noise_ratio
+        self.zcr_max = zcr_max
+        self.start_frames = start_frames
+        self.hangover_frames = hangover_frames
+        self.noise_floor = min_rms / noise_ratio
+        self.speaking = False
+        self.voiced_run = 0     # consecutive voiced frames
+        self.quiet_run = 0      # consecutive unvoiced frames
+        self.speech_frames = 0  # voiced frames in the current speech segment
+
+    def is_voiced(self, pcm16: np.ndarray) -> bool:
+        if not len(pcm16):
+            return False
+        samples = pcm16.astype(np.float64)
+        rms = float(np.sqrt(np.mean(samples * samples)))
+        threshold = max(self.min_rms, self.noise_floor * self.noise_ratio)
+        if rms < threshold:
+            # Track the noise floor only on frames that are clearly not speech
+            self.noise_floor += 0.05 * (rms - self.noise_floor)
+            return False
+        zcr = np.count_nonzero(np.diff(np.signbit(pcm16))) / len(pcm16)
+        return zcr <= self.zcr_max or rms >= 2 * threshold
+
+    def process(self, pcm16: np.ndarray):
+        if self.is_voiced(pcm16):
+            self.voiced_run += 1
+            self.quiet_run = 0
+            if self.speaking:
+                self.speech_frames += 1
+            elif self.voiced_run >= self.start_frames:
+                self.speaking = True
+                self.speech_frames = self.voiced_run
+                return "speech_start"
+        else:
+            self.voiced_run = 0
+            self.quiet_run += 1
+            if self.speaking and self.quiet_run >= self.hangover_frames:
+                self.speaking = False
+                self.speech_frames = 0
+                return "speech_end"
+        return None
 
 class AudioBridge:
     def __init__(self):
-        self._up_state = None   # Twilio -> STT (upsample)
-        self._down_state = None # TTS -> Twilio (downsample)
+        self._up_state = Upsampler()     # Twilio -> STT (upsample)
+        self._down_state = Downsampler() # TTS -> Twilio (downsample)
+        self.vad = VoiceActivityDetector()
 
     # Twilio (μ-law 8k) -> PCM16 16k (AAI için)
     def ulaw8k_to_pcm16_16k(self, ulaw_bytes: bytes) -> bytes:
-        pcm8k = audioop.ulaw2lin(ulaw_bytes, 2)             # μ-law 8k --> PCM16 8k
-        pcm16k, self._up_state = audioop.ratecv(pcm8k, 2, 1, 8000, 16000, self._up_state)
+        pcm16k, _ = self.process_inbound(ulaw_bytes, vad=False)
         return pcm16k
 
+    # Twilio (μ-law 8k) -> PCM16 16k plus VAD event ("speech_start"/"speech_end"/None)
+    def process_inbound(self, ulaw_bytes: bytes, vad=True):
+        pcm8k = ulaw_decode(ulaw_bytes)                     # μ-law 8k --> PCM16 8k
+        vad_event = self.vad.process(pcm8k) if vad else None
+        pcm16k = self._up_state.process(pcm8k).tobytes()
+        return pcm16k, vad_event
+
     # TTS (PCM16 16k) -> μ-law 8k (Twilio için)
     def pcm16_16k_to_ulaw8k(self, pcm16k_bytes: bytes) -> bytes:
-        pcm8k, self._down_state = audioop.ratecv(pcm16k_bytes, 2, 1, 16000, 8000, self._down_state)
-        ulaw8k = audioop.lin2ulaw(pcm8k, 2)
+        pcm8k = self._down_state.process(np.frombuffer(pcm16k_bytes, dtype="<i2"))
+        ulaw8k = ulaw_encode(pcm8k)
         return ulaw8k
 
+    # Same conversions through the shared batch engine when it is running
+    async def process_inbound_batched(self, ulaw_bytes: bytes, engine):
+        if engine is None or not engine.running:
+            return self.process_inbound(ulaw_bytes)
+        pcm8k, pcm16k = await engine.inbound(self._up_state, ulaw_bytes)
+        return pcm16k, self.vad.process(pcm8k)
+
+    async def pcm16_16k_to_ulaw8k_batched(self, pcm16k_bytes: bytes, engine) -> bytes:
+        if engine is None or not engine.running:
+            return self.pcm16_16k_to_ulaw8k(pcm16k_bytes)
+        return await engine.outbound(self._down_state, pcm16k_bytes)
+
 def chunk_ulaw(ulaw_bytes: bytes, frame_ms=20, sps=8000):
-    """Split μ-law audio into 20ms frames for Twilio"""
+    """Split μ-law audio into 20ms frames for Twilio (memoryview slices, no copies)"""
     frame = int(sps * frame_ms / 1000)  # 160 byte / 20ms
-    for i in range(0, len(ulaw_bytes), frame):
-        yield ulaw_bytes[i:i+frame]
+    view = memoryview(ulaw_bytes)
+    for i in range(0, len(view), frame):
+        yield view[i:i+frame]
 
-def log_call_event(event_type, details, call_sid=None):
-    """Log call events with timestamps to callslog"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    log_entry = f"[{timestamp}] {event_type}: {details}"
-    if call_sid:
-        log_entry += f" (Call SID: {call_sid})"
-    
-    # Write to callslog file
-    with open('callslog', 'a', encoding='utf-8') as f:
-        f.write(log_entry + '\n')
-    
-    logger.info(log_entry)
+class UlawFramer:
+    """Re-chunk a μ-law stream of arbitrary chunk sizes into 20ms Twilio frames"""
+
+    def __init__(self, frame_ms=20, sps=8000):
+        self.frame = int(sps * frame_ms / 1000)
+        self.buffer = b""
 
-app = FastAPI()
+    def feed(self, ulaw_bytes: bytes):
+        """Return every complete frame; the remainder waits for more audio"""
+        # Frames are views into an immutable buffer, so it is never copied per frame
+        self.buffer = self.buffer + ulaw_bytes if self.buffer else bytes(ulaw_bytes)
+        usable = len(self.buffer) - len(self.buffer) % self.frame
+        frames = list(chunk_ulaw(memoryview(self.buffer)[:usable]))
+        self.buffer = self.buffer[usable:]
+        return frames
+
+    def flush(self):
+        """Return the final, possibly short, frame"""
+        rest, self.buffer = self.buffer, b""
+        return [rest] if rest else []
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared upstream connection pools for the lifetime of the app"""
+    await http_clients.start()
+    log_call_event("HTTP_POOLS_READY", f"Shared HTTP clients started (http2={http_clients.http2})")
+    log_call_event("TTS_FORMAT", f"TTS output format: {tts_format().name} (native μ-law: {tts_format().native_ulaw})")
+    if TRANSCODE_BATCHING:
+        transcoder.start()
+    if STT_POOL_ENABLED:
+        stt_pool.start()
+    warmup = asyncio.create_task(warm_tts_cache())
+    try:
+        yield
+    finally:
+        warmup.cancel()
+        await prewarmer.aclose()
+        await stt_pool.aclose()
+        log_call_event("STT_POOL_STATS", f"STT session pool: {stt_pool.stats()}")
+        log_call_event("PREWARM_STATS", f"Call pre-warming: {prewarmer.stats()}")
+        for task in campaigns.values():
+            task.cancel()  # unfinished rows resume when the campaign is started again
+        await asyncio.gather(*campaigns.values(), return_exceptions=True)
+        await transcoder.stop()
+        log_call_event("TRANSCODER_STATS", f"Transcode engine: {transcoder.stats()}")
+        log_call_event("LLM_USAGE_STATS", f"LLM token usage: {llm_usage.stats()}")
+        await http_clients.aclose()
+        twilio.close()
+        call_store.close()
+        log_call_event("HTTP_POOLS_CLOSED", "Shared HTTP clients closed")
+
+app = FastAPI(lifespan=lifespan)
 
 # Add middleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
@@ -181,13 +419,17 @@ async def start_call(request: Request):
         
         log_call_event("CALL_START", f"Attempting to call {to_number} using {TWILIO_NUMBER}")
         
-        call = twilio.calls.create(
+        call = await twilio.create_call(
             to=to_number,
             from_=TWILIO_NUMBER,
-            url=f"https://{PUBLIC_HOST}/answer"
+            url=f"https://{PUBLIC_HOST}/answer",
+            status_callback=f"https://{PUBLIC_HOST}/status",
+            status_callback_event=STATUS_CALLBACK_EVENTS
         )
         
         call_sid = call.sid
+        call_store.update(call_sid, "created", status=call.status, to=to_number, from_number=TWILIO_NUMBER)
+        prewarmer.start(call_sid)
         log_call_event("CALL_CREATED", f"Call initiated with SID: {call_sid}", call_sid)
         
         return {"sid": call_sid, "status": "initiated"}
@@ -197,6 +439,85 @@ async def start_call(request: Request):
         logger.error(f"Error in start_call: {e}")
         raise HTTPException(500, str(e))
 
+# Campaign name -> running dialer task
+campaigns = {}
+# One CPS budget and one concurrency cap for all campaigns in this process
+campaign_bucket = TokenBucket(CAMPAIGN_CPS)
+campaign_slots = asyncio.Semaphore(CAMPAIGN_MAX_CONCURRENT)
+CAMPAIGN_MAX_ROWS = int(os.getenv("CAMPAIGN_MAX_ROWS", "1000"))  # per request; larger lists go through campaign.py
+campaign_store = None
+
+def get_campaign_store():
+    global campaign_store
+    if campaign_store is None:
+        campaign_store = CampaignStore()
+    return campaign_store
+
+@app.post("/campaigns")
+@limiter.limit("10/minute")
+async def start_campaign(request: Request):
+    """Load a contact list ({"name": ..., "rows": [{"to": ..., ...}]}) and start dialing it"""
+    require_operator(request)
+    data = await request.json()
+    name = data.get("name")
+    if not name:
+        raise HTTPException(400, "name is required")
+    rows = data.get("rows", [])
+    if not isinstance(rows, list):
+        raise HTTPException(400, "rows must be a list")
+    if len(rows) > CAMPAIGN_MAX_ROWS:
+        raise HTTPException(413, f"At most {CAMPAIGN_MAX_ROWS} rows per request")
+    try:
+        rows = [parse_row(row) for row in rows]
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    
+    store = get_campaign_store()
+    added = await asyncio.to_thread(store.add_rows, name, rows)
+    if name not in campaigns or campaigns[name].done():
+        dialer = CampaignDialer(twilio, TWILIO_NUMBER, f"https://{PUBLIC_HOST}/answer", store,
+                                status_callback=f"https://{PUBLIC_HOST}/status", call_store=call_store,
+                                on_call_created=prewarmer.start, bucket=campaign_bucket, slots=campaign_slots)
+        campaigns[name] = asyncio.create_task(dialer.run(name), name=f"campaign:{name}")
+    log_call_event("CAMPAIGN_LOADED", f"Campaign {name}: {added} new rows")
+    return {"name": name, "added": added, "progress": store.progress(name)}
+
+@app.get("/campaigns/{name}")
+async def campaign_status(name: str, request: Request):
+    """Progress counts for a campaign"""
+    require_operator(request)
+    task = campaigns.get(name)
+    return {
+        "name": name,
+        "running": task is not None and not task.done(),
+        "progress": get_campaign_store().progress(name),
+    }
+
+@app.post("/status")
+async def call_status(request: Request):
+    """Twilio status callback: record the call's progress"""
+    body = await request.body()
+    if not await verify_twilio_signature(request, body):
+        raise HTTPException(403, "Invalid Twilio signature")
+    
+    form = await request.form()
+    call_sid = form.get("CallSid")
+    fields = {"status": form.get("CallStatus")}
+    if form.get("CallDuration"):
+        fields["duration"] = int(form["CallDuration"])
+    call_store.update(call_sid, "status", **fields)
+    log_call_event("CALL_STATUS", f"Call status: {fields['status']}", call_sid)
+    return Response(status_code=204)
+
+@app.get("/calls/{sid}")
+async def get_call(sid: str, request: Request):
+    """Current state of a call, by Call SID or stream SID"""
+    require_operator(request)
+    record = call_store.find(sid)
+    if record is None:
+        raise HTTPException(404, "Unknown call")
+    return record
+
 @app.post("/answer")
 async def answer(request: Request):
     """Handle incoming call and create TwiML response"""
@@ -207,8 +528,14 @@ async def answer(request: Request):
         if not await verify_twilio_signature(request, body):
             raise HTTPException(403, "Invalid Twilio signature")
         
+        form = await request.form()
+        call_sid = form.get("CallSid")
+        call_store.update(call_sid, "answered", status=form.get("CallStatus") or "in-progress")
+        # Inbound calls start warming here; outbound ones already did at /call
+        prewarmer.start(call_sid)
+        
         # Generate WebSocket token
-        stream_token = make_ws_token()
+        stream_token = make_ws_token(call_sid=call_sid)
         
         log_call_event("ANSWER_ENDPOINT", f"Generated stream token: {stream_token}")
         
@@ -233,6 +560,10 @@ async def answer(request: Request):
             name="ai_stream"
         )
         
+        # Campaign dynamic variables arrive on the answer URL; hand them to the stream
+        for name, value in request.query_params.items():
+            stream.parameter(name=name, value=value)
+        
         log_call_event("TWIML_GENERATED", f"TwiML response created with WebSocket URL: wss://{PUBLIC_HOST}/stream?token={stream_token}")
         
         return Response(str(response), media_type="application/xml")
@@ -270,16 +601,70 @@ async def stt_connect():
         logger.error(f"STT connection failed: {e}")
         raise
 
-async def stt_send_audio(ws_stt, audio_bytes):
+# Uplink audio: raw binary WebSocket frames (AssemblyAI accepts them) or base64 JSON
+STT_AUDIO_BINARY = os.getenv("STT_AUDIO_BINARY", "1") == "1"
+STT_CHUNK_MS = int(os.getenv("STT_CHUNK_MS", "100"))  # audio per uplink message
+STT_MIN_CHUNK_MS = 100  # AssemblyAI closes the session on shorter audio messages
+
+async def stt_send_audio(ws_stt, audio_bytes, binary=STT_AUDIO_BINARY):
     """Send audio to STT service"""
     try:
-        audio_b64 = base64.b64encode(audio_bytes).decode()
-        await ws_stt.send(json.dumps({"audio_data": audio_b64}))
+        if binary:
+            await ws_stt.send(bytes(audio_bytes))
+        else:
+            audio_b64 = base64.b64encode(audio_bytes).decode()
+            await ws_stt.send('{"audio_data":"' + audio_b64 + '"}')
         log_call_event("STT_AUDIO_SENT", f"Audio sent to STT: {len(audio_bytes)} bytes")
     except Exception as e:
         log_call_event("STT_SEND_ERROR", f"Failed to send audio to STT: {str(e)}")
         logger.error(f"Failed to send audio to STT: {e}")
 
+class SttUplink:
+    """Aggregates 20 ms PCM frames into STT_CHUNK_MS messages for one STT session.
+
+    ``flush`` sends the buffered audio early, padded with silence to a full
+    chunk; the caller uses it at end of speech, so aggregation never delays
+    the end of an utterance. ``keepalive`` sends one chunk of silence.
+    """
+
+    def __init__(self, ws_stt, chunk_ms=STT_CHUNK_MS, binary=STT_AUDIO_BINARY, sample_rate=16000):
+        self.ws_stt = ws_stt
+        self.binary = binary
+        self.chunk_bytes = int(sample_rate * 2 * max(chunk_ms, STT_MIN_CHUNK_MS) / 1000)
+        self.buffer = bytearray()
+        self.messages = 0
+        self.bytes_sent = 0
+
+    async def send(self, pcm16):
+        self.buffer += pcm16
+        if len(self.buffer) >= self.chunk_bytes:
+            await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        if len(self.buffer) < self.chunk_bytes:
+            self.buffer += bytes(self.chunk_bytes - len(self.buffer))  # PCM16 silence
+        chunk = bytes(self.buffer)
+        self.buffer.clear()
+        await stt_send_audio(self.ws_stt, chunk, self.binary)
+        self.messages += 1
+        self.bytes_sent += len(chunk)
+
+    async def keepalive(self):
+        await self.flush()
+        self.buffer += bytes(self.chunk_bytes)
+        await self.flush()
+
+async def stt_force_endpoint(ws_stt):
+    """Ask AssemblyAI to finalize the current utterance now"""
+    try:
+        await ws_stt.send(json.dumps({"force_end_utterance": True}))
+        log_call_event("STT_FORCE_ENDPOINT", "Forced end of utterance after local speech end")
+    except Exception as e:
+        log_call_event("STT_SEND_ERROR", f"Failed to force STT endpoint: {str(e)}")
+        logger.error(f"Failed to force STT endpoint: {e}")
+
 async def stt_recv(ws_stt):
     """Receive messages from STT service"""
     try:
@@ -292,78 +677,147 @@ async def stt_recv(ws_stt):
         logger.error(f"STT receive error: {e}")
         return None
 
-async def llm_respond(text):
+async def stt_listen(ws_stt, events: asyncio.Queue):
+    """Consume AssemblyAI messages as they arrive and publish transcript events.
+
+    Pushes ("partial", text) and ("final", text) tuples onto ``events``;
+    returns when the STT session ends.
+    """
+    try:
+        async for msg in ws_stt:
+            data = json.loads(msg)
+            message_type = data.get("message_type", "unknown")
+            log_call_event("STT_MESSAGE", f"STT message: {message_type}")
+            
+            text = data.get("text", "").strip()
+            if message_type in ("PartialTranscript", "partial"):
+                if text:
+                    queue_put_latest(events, ("partial", text))
+            elif message_type in ("FinalTranscript", "final"):
+                if text:
+                    log_call_event("STT_FINAL", f"STT final transcript: '{text}'")
+                    queue_put_latest(events, ("final", text))
+            elif message_type == "SessionTerminated":
+                log_call_event("STT_SESSION_TERMINATED", "STT session terminated by provider")
+                return
+    except websockets.ConnectionClosed as e:
+        log_call_event("STT_DISCONNECTED", f"STT connection closed: {str(e)}")
+
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+LLM_FALLBACK = "Anladım. Devam edebilirsiniz."
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") == "1"
+llm_usage = UsageStats()
+
+def llm_headers():
+    return {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+
+def record_llm_usage(usage):
+    """Add a response's token usage to the totals and log the prompt-cache hit"""
+    prompt, cached, completion = llm_usage.record(usage)
+    if usage:
+        log_call_event("LLM_USAGE", f"Tokens: prompt={prompt} (cached={cached}), completion={completion}")
+
+def llm_request_body(text, stream=False, memory=None, template=None) -> bytes:
+    """Serialized chat completion request for the caller's latest utterance, after the call's history"""
+    template = template or get_template()
+    history = memory.encoded() if memory is not None else []
+    return template.body(history, f"Kullanıcının son sözü: {text}", stream=stream)
+
+async def llm_respond(text, memory=None, template=None):
     """Get response from OpenAI LLM"""
     try:
-        system_prompt = """Rolün: Su arıtma cihazı bakım danışmanı. 
-        Türkçe, nazik, 2-3 cümlelik yanıtlar ver. 
-        KVKK'ya uygun davran. 
-        "Hayır, istemiyorum" diyenlere ısrar etme. 
-        Hedefler: (1) Uygun zaman teyidi, (2) Filtre-bakım ihtiyacı, (3) Randevu, (4) WhatsApp bilgi.
-        Kaçın: Uzun konuşma, teknik detaya boğma, fiyatı net sormadan söyleme.
-        Duygular: Sakin, çözüm odaklı, saygılı."""
+        log_call_event("LLM_REQUEST", f"LLM request for text: '{text[:50]}...'")
         
-        user_prompt = f"Kullanıcının son sözü: {text}"
+        client = get_client("openai")
+        r = await client.post(
+            OPENAI_CHAT_URL,
+            headers=llm_headers(),
+            content=llm_request_body(text, memory=memory, template=template)
+        )
+        r.raise_for_status()
+        data = r.json()
+        record_llm_usage(data.get("usage"))
+        response = data["choices"][0]["message"]["content"].strip()
         
-        log_call_event("LLM_REQUEST", f"LLM request for text: '{text[:50]}...'")
+        # Filter response
+        filtered_response = filter_response(response)
         
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
-                json={
-                    "model": "gpt-4o-mini",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    "max_tokens": 150,
-                    "temperature": 0.4
-                }
-            )
-            r.raise_for_status()
-            data = r.json()
-            response = data["choices"][0]["message"]["content"].strip()
-            
-            # Filter response
-            filtered_response = filter_response(response)
-            
-            log_call_event("LLM_RESPONSE", f"LLM response: '{filtered_response[:50]}...'")
-            
-            return filtered_response
+        log_call_event("LLM_RESPONSE", f"LLM response: '{filtered_response[:50]}...'")
+        
+        return filtered_response
             
     except Exception as e:
         log_call_event("LLM_ERROR", f"LLM error: {str(e)}")
         logger.error(f"LLM error: {e}")
-        return "Anladım. Devam edebilirsiniz."
+        return LLM_FALLBACK
+
+async def llm_respond_stream(text, memory=None, template=None):
+    """Stream the OpenAI response as filtered sentence/clause segments.
 
-async def tts_synthesize(text) -> bytes:
-    """Synthesize speech using Azure TTS"""
+    Each segment is yielded as soon as the model finishes it, so TTS for the
+    first sentence can start while the rest is still being generated.
+    """
+    segmenter = SentenceSegmenter()
+    response_filter = ResponseFilter()
     try:
-        log_call_event("TTS_START", f"TTS starting for text: '{text[:50]}...'")
+        log_call_event("LLM_REQUEST", f"LLM streaming request for text: '{text[:50]}...'")
         
-        # Enhanced SSML for natural Turkish speech
-        ssml = f"""<speak version='1.0' xml:lang='tr-TR'>
-            <voice name='tr-TR-EmelNeural'>
-                <prosody rate="-5%">{text}</prosody>
-            </voice>
-        </speak>"""
+        client = get_client("openai")
+        async with client.stream(
+            "POST",
+            OPENAI_CHAT_URL,
+            headers=llm_headers(),
+            content=llm_request_body(text, stream=True, memory=memory, template=template)
+        ) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                chunk = line[5:].strip()
+                if chunk == "[DONE]":
+                    break
+                event = json.loads(chunk)
+                if event.get("usage"):
+                    # Sent in a last chunk with no choices (stream_options.include_usage)
+                    record_llm_usage(event["usage"])
+                choices = event.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if not delta:
+                    continue
+                for segment in segmenter.feed(delta):
+                    for filtered in response_filter.feed(segment):
+                        yield filtered
+                if response_filter.done:
+                    break
         
-        url = f"https://{AZURE_TTS_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
-        headers = {
-            "Ocp-Apim-Subscription-Key": AZURE_TTS_KEY,
-            "Content-Type": "application/ssml+xml",
-            "X-Microsoft-OutputFormat": "raw-16khz-16bit-mono-pcm"  # <-- Doğru format
-        }
+        for segment in segmenter.flush():
+            for filtered in response_filter.feed(segment):
+                yield filtered
+        for filtered in response_filter.finish():
+            yield filtered
         
-        async with httpx.AsyncClient(timeout=60) as client:
-            r = await client.post(url, headers=headers, content=ssml)
-            r.raise_for_status()
-            
-            audio_bytes = r.content
-            log_call_event("TTS_SUCCESS", f"TTS successful, received {len(audio_bytes)} bytes of audio")
+        log_call_event("LLM_RESPONSE", f"LLM response: '{response_filter.text[:50]}...'")
             
-            return audio_bytes
+    except Exception as e:
+        log_call_event("LLM_ERROR", f"LLM streaming error: {str(e)}")
+        logger.error(f"LLM streaming error: {e}")
+        if not response_filter.spoken:
+            yield LLM_FALLBACK
+
+async def tts_synthesize(text, output_format=None) -> bytes:
+    """Synthesize speech using Azure TTS, in the negotiated output format unless one is given"""
+    try:
+        log_call_event("TTS_START", f"TTS starting for text: '{text[:50]}...'")
+        
+        url, headers, ssml = azure_tts_request(text, output_format)
+        client = get_client("azure_tts")
+        r = await client.post(url, headers=headers, content=ssml)
+        r.raise_for_status()
+        
+        audio_bytes = r.content
+        log_call_event("TTS_SUCCESS", f"TTS successful, received {len(audio_bytes)} bytes of audio")
+        
+        return audio_bytes
             
     except Exception as e:
         log_call_event("TTS_ERROR", f"TTS synthesis failed: {str(e)}")
@@ -372,20 +826,646 @@ async def tts_synthesize(text) -> bytes:
 
 
 
-async def twilio_send_audio(ws_twilio, mulaw_bytes, stream_sid):
-    """Send audio back to Twilio"""
+TTS_STREAMING = os.getenv("TTS_STREAMING", "1") == "1"
+TTS_VOICE = "tr-TR-EmelNeural"
+TTS_PROSODY_RATE = "-5%"
+TTS_WORDS_PER_SECOND = float(os.getenv("TTS_WORDS_PER_SECOND", "2.5"))  # speech rate of TTS_VOICE at TTS_PROSODY_RATE
+
+# Output formats negotiated once per worker: native μ-law 8k where the provider has it
+AZURE_TTS_FORMAT = negotiate("azure")
+AZURE_PCM_FORMAT = negotiate("azure", native_ulaw=False)  # Retell fallback mixes with PCM
+RETELL_TTS_FORMAT = negotiate("retell")
+
+tts_cache = TTSCache()
+
+# One transcoding engine per worker batches codec work across all calls
+TRANSCODE_BATCHING = os.getenv("TRANSCODE_BATCHING", "1") == "1"
+transcoder = TranscodeEngine()
+
+def azure_tts_request(text, output_format=None):
+    """URL, headers and SSML body for an Azure TTS request"""
+    output_format = output_format or AZURE_TTS_FORMAT
+    # Enhanced SSML for natural Turkish speech
+    ssml = f"""<speak version='1.0' xml:lang='tr-TR'>
+            <voice name='{TTS_VOICE}'>
+                <prosody rate="{TTS_PROSODY_RATE}">{text}</prosody>
+            </voice>
+        </speak>"""
+    
+    url = f"https://{AZURE_TTS_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
+    headers = {
+        "Ocp-Apim-Subscription-Key": AZURE_TTS_KEY,
+        "Content-Type": "application/ssml+xml",
+        "X-Microsoft-OutputFormat": output_format.name
+    }
+    return url, headers, ssml
+
+def tts_format():
+    """Output format of the configured TTS provider"""
+    return RETELL_TTS_FORMAT if os.getenv("USE_RETELL_TTS") == "1" else AZURE_TTS_FORMAT
+
+def tts_cache_key(text, output_format=None):
+    """Cache key for text as the configured TTS provider would render it"""
+    output_format = output_format or tts_format()
+    return cache_key(text, TTS_VOICE, TTS_PROSODY_RATE, output_format.cache_id)
+
+def tts_to_ulaw8k(audio, output_format):
+    """Wire audio for a complete TTS rendering; native μ-law passes through untouched"""
+    if output_format.native_ulaw:
+        return audio
+    return AudioBridge().pcm16_16k_to_ulaw8k(audio)
+
+async def tts_synthesize_stream(text, output_format=None):
+    """Synthesize speech using Azure TTS, yielding audio chunks as they arrive"""
     try:
-        payload = base64.b64encode(mulaw_bytes).decode()
-        await ws_twilio.send_text(json.dumps({
-            "event": "media",
-            "streamSid": stream_sid,
-            "media": {"payload": payload}
-        }))
+        log_call_event("TTS_START", f"TTS streaming started for text: '{text[:50]}...'")
+        
+        url, headers, ssml = azure_tts_request(text, output_format)
+        total = 0
+        client = get_client("azure_tts")
+        async with client.stream("POST", url, headers=headers, content=ssml) as r:
+            r.raise_for_status()
+            async for chunk in r.aiter_bytes():
+                total += len(chunk)
+                yield chunk
+        
+        log_call_event("TTS_SUCCESS", f"TTS stream finished, received {total} bytes of audio")
+        
+    except Exception as e:
+        log_call_event("TTS_ERROR", f"TTS streaming failed: {str(e)}")
+        logger.error(f"TTS streaming failed: {e}")
+        raise
+
+async def twilio_send_audio(ws_twilio, mulaw_bytes, stream_sid, envelope=None):
+    """Send audio back to Twilio; pass the call's MediaEnvelope to skip building the JSON"""
+    try:
+        if envelope is None:
+            envelope = MediaEnvelope(stream_sid)
+        await ws_twilio.send_text(envelope.media(mulaw_bytes))
         log_call_event("TWILIO_AUDIO_SENT", f"Audio sent to Twilio: {len(mulaw_bytes)} bytes")
     except Exception as e:
         log_call_event("TWILIO_SEND_ERROR", f"Failed to send audio to Twilio: {str(e)}")
         logger.error(f"Failed to send audio to Twilio: {e}")
 
+async def twilio_send_clear(ws_twilio, stream_sid):
+    """Tell Twilio to drop any audio it has buffered but not yet played"""
+    try:
+        await ws_twilio.send_text(json.dumps({"event": "clear", "streamSid": stream_sid}))
+        log_call_event("TWILIO_CLEAR_SENT", "Clear event sent to Twilio", stream_sid)
+    except Exception as e:
+        log_call_event("TWILIO_SEND_ERROR", f"Failed to send clear to Twilio: {str(e)}")
+        logger.error(f"Failed to send clear to Twilio: {e}")
+
+async def twilio_send_mark(ws_twilio, stream_sid, name):
+    """Ask Twilio to echo `name` back once the audio sent before it has played"""
+    try:
+        await ws_twilio.send_text(json.dumps({"event": "mark", "streamSid": stream_sid, "mark": {"name": name}}))
+    except Exception as e:
+        log_call_event("TWILIO_SEND_ERROR", f"Failed to send mark to Twilio: {str(e)}")
+        logger.error(f"Failed to send mark to Twilio: {e}")
+
+# Per-call queue bounds, in 20 ms frames unless noted
+INBOUND_QUEUE_FRAMES = int(os.getenv("INBOUND_QUEUE_FRAMES", "250"))     # ~5 s of caller audio
+OUTBOUND_QUEUE_FRAMES = int(os.getenv("OUTBOUND_QUEUE_FRAMES", "1500"))  # ~30 s of bot audio
+DIALOG_QUEUE_SIZE = int(os.getenv("DIALOG_QUEUE_SIZE", "16"))           # pending turns
+STT_EVENT_QUEUE_SIZE = int(os.getenv("STT_EVENT_QUEUE_SIZE", "64"))     # transcript events
+END_OF_UTTERANCE_MS = int(os.getenv("END_OF_UTTERANCE_MS", "250"))      # quiet time after a final
+MEDIA_TIMEOUT = 30  # seconds without media events before the call is dropped
+
+# Barge-in: caller speech while the bot is talking stops playback
+BARGE_IN_ENABLED = os.getenv("BARGE_IN", "1") == "1"
+BARGE_IN_MIN_WORDS = int(os.getenv("BARGE_IN_MIN_WORDS", "2"))  # STT partial length that counts as speech
+
+# Start the LLM on stable partials/finals before end of utterance (needs LLM_STREAMING)
+SPECULATIVE_LLM = os.getenv("SPECULATIVE_LLM", "1") == "1"
+BARGE_IN_FRAMES = int(os.getenv("BARGE_IN_FRAMES", "10"))       # voiced VAD frames (200 ms)
+
+# VAD gating of the STT uplink: only speech (plus pre-roll) is sent upstream
+VAD_GATING = os.getenv("VAD_GATING", "1") == "1"
+VAD_PREROLL_FRAMES = int(os.getenv("VAD_PREROLL_FRAMES", "10"))    # audio kept from before speech start
+VAD_KEEPALIVE_MS = int(os.getenv("VAD_KEEPALIVE_MS", "5000"))      # silence frame interval while idle
+
+INITIAL_GREETING = "Merhaba, ben su arıtma cihazınızın bakım asistanıyım. Size nasıl yardımcı olabilirim?"
+
+# Fixed utterances kept pre-rendered in the TTS cache
+KNOWN_PROMPTS = [INITIAL_GREETING, ENDING_FALLBACK, SHORT_FALLBACK, LLM_FALLBACK]
+
+async def render_prompt(text):
+    """Make sure a fixed prompt's audio is in the TTS cache"""
+    output_format = tts_format()
+    key = tts_cache_key(text, output_format)
+    if await tts_cache.get(key) is not None:
+        return
+    try:
+        if output_format.provider == "retell":
+            audio = await retell_tts_synthesize(text)
+        else:
+            audio = await tts_synthesize(text, output_format)
+        await tts_cache.put(key, tts_to_ulaw8k(audio, output_format), persist=True)
+        log_call_event("TTS_CACHE_WARMED", f"Pre-rendered prompt: '{text[:50]}...'")
+    except Exception as e:
+        log_call_event("TTS_CACHE_WARM_ERROR", f"Could not pre-render prompt: {str(e)}")
+
+async def warm_tts_cache():
+    """Render every known prompt that is not cached yet (runs at startup)"""
+    for text in KNOWN_PROMPTS:
+        await render_prompt(text)
+    log_call_event("TTS_CACHE_READY", f"TTS cache stats: {tts_cache.stats()}")
+
+async def warm_call_shared():
+    """Per-call warm-up that is not tied to the call: the greeting audio (pools stay warm on their own)"""
+    await render_prompt(INITIAL_GREETING)
+
+async def stt_close(ws_stt):
+    await ws_stt.close()
+
+# Ready STT sessions for new calls; pre-warming and /stream both check out from here
+STT_POOL_ENABLED = os.getenv("STT_POOL_ENABLED", "1") == "1"
+stt_pool = SttSessionPool(stt_connect)
+
+async def stt_checkout():
+    return await (stt_pool.checkout() if STT_POOL_ENABLED else stt_connect())
+
+async def stt_checkout_session():
+    if STT_POOL_ENABLED:
+        return await stt_pool.checkout_session()
+    return PooledSession(await stt_connect())
+
+prewarmer = CallPrewarmer(stt_checkout_session, stt_close, warm_call_shared, max_age_s=stt_pool.max_age_s)
+
+def queue_put_latest(queue: asyncio.Queue, item):
+    """Put without waiting; when the queue is full drop the oldest item instead"""
+    while True:
+        try:
+            queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+
+def speech_frames(text):
+    """Estimated 20 ms frames of TTS audio for text"""
+    return int(len(text.split()) / TTS_WORDS_PER_SECOND * 50)
+
+def heard_text(segments, played):
+    """Text of a bot turn's (text, first frame, end frame) segments up to the played position.
+
+    A segment cut mid-way keeps the share of its words matching the share of
+    its audio that played.
+    """
+    if played is None:
+        return " ".join(text for text, _, _ in segments)
+    heard = []
+    for text, start, end in segments:
+        if played <= start or end <= start:
+            break
+        if played >= end:
+            heard.append(text)
+            continue
+        words = text.split()
+        count = len(words) * (played - start) // (end - start)
+        if count:
+            heard.append(" ".join(words[:count]) + "…")
+        break
+    return " ".join(heard)
+
+class CallPipeline:
+    """Full-duplex task graph for a single Twilio media stream.
+
+    twilio_reader -> stt_audio -> stt_sender -> AssemblyAI
+    AssemblyAI -> stt_listener -> stt_events -> turn_detector -> dialog
+    dialog -> dialog_worker -> outbound (paced scheduler) -> Twilio
+
+    Every stage runs as its own task, so a long bot turn never stops the
+    inbound Twilio audio from being read and forwarded to STT.
+    """
+
+    def __init__(self, websocket: WebSocket, ws_stt):
+        self.websocket = websocket
+        self.ws_stt = ws_stt
+        self.bridge = AudioBridge()
+        self.stream_sid = None
+        self.call_sid = None
+        self.call_variables = {}
+        self.envelope = None
+        self.last_audio_time = time.time()
+        self.stt_audio = asyncio.Queue(maxsize=INBOUND_QUEUE_FRAMES)  # caller (inbound track) audio only
+        self.track_frames = {}  # media frames received per track
+        self.stt_events = asyncio.Queue(maxsize=STT_EVENT_QUEUE_SIZE)
+        self.dialog = asyncio.Queue(maxsize=DIALOG_QUEUE_SIZE)
+        self.outbound = OutboundAudioScheduler(self.send_frame, max_frames=OUTBOUND_QUEUE_FRAMES,
+                                               send_mark=self.send_mark)
+        self.marks = {}  # mark name -> frames sent when it went out, until Twilio echoes it
+        self.mark_seq = 0
+        self.frames_played = 0
+        self.memory = ConversationMemory()
+        self.template = get_template()
+        self.bot_turn = None
+        self.turn_task = None  # last bot turn, kept after a barge-in until it has wound down
+        self.turn_segments = []  # (text, first frame, end frame) of the last bot turn, as queued
+        self.heard_until = None  # played position at the barge-in that cut the running turn
+        self.speculation = None
+        self.speculation_stats = SpeculationStats()
+        self.barge_ins = 0
+        self.stt_uplink = SttUplink(ws_stt)
+        self.stt_frames_sent = 0
+        self.stt_frames_gated = 0
+
+    async def run(self):
+        """Run all stages until one of them ends, then tear the rest down"""
+        tasks = [
+            asyncio.create_task(self.twilio_reader(), name="twilio_reader"),
+            asyncio.create_task(self.stt_sender(), name="stt_sender"),
+            asyncio.create_task(stt_listen(self.ws_stt, self.stt_events), name="stt_listener"),
+            asyncio.create_task(self.turn_detector(), name="turn_detector"),
+            asyncio.create_task(self.dialog_worker(), name="dialog_worker"),
+            asyncio.create_task(self.outbound.run(), name="playout"),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception():
+                    log_call_event("PIPELINE_ERROR", f"{task.get_name()} failed: {task.exception()}", self.stream_sid)
+                else:
+                    log_call_event("PIPELINE_STAGE_ENDED", f"{task.get_name()} finished", self.stream_sid)
+        finally:
+            if self.bot_turn is not None:
+                tasks.append(self.bot_turn)
+            if self.speculation is not None:
+                self.speculation.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            log_call_event("PLAYOUT_STATS", f"Outbound audio: {self.outbound.stats()}, played: {self.frames_played}", self.stream_sid)
+            call_store.update(self.call_sid, "stream_ended", stream_sid=self.stream_sid,
+                              barge_ins=self.barge_ins, played_ms=self.frames_played * 20)
+            log_call_event("STT_UPLINK_STATS", f"STT frames sent: {self.stt_frames_sent} in {self.stt_uplink.messages} messages "
+                                               f"(binary={self.stt_uplink.binary}), gated: {self.stt_frames_gated}, "
+                                               f"received by track: {self.track_frames}", self.stream_sid)
+            log_call_event("MEMORY_STATS", f"Conversation memory: {self.memory.stats()}", self.stream_sid)
+            log_call_event("SPECULATION_STATS", f"Speculative LLM: {self.speculation_stats.stats()}", self.stream_sid)
+
+    async def twilio_reader(self):
+        """Read Twilio events and hand media to the STT queue without ever waiting on it"""
+        while True:
+            try:
+                # Check for media timeout
+                if time.time() - self.last_audio_time > MEDIA_TIMEOUT:
+                    log_call_event("MEDIA_TIMEOUT", f"No media events for {MEDIA_TIMEOUT} seconds, closing connection")
+                    return
+                
+                # Receive message from Twilio
+                msg = await asyncio.wait_for(self.websocket.receive_text(), timeout=1.0)
+                
+                # Media events are ~50/s; pull the payload out without a full JSON decode
+                media = parse_media(msg)
+                if media is not None:
+                    self.handle_media(*media)
+                    continue
+                
+                data = json.loads(msg)
+                event_type = data.get("event")
+                
+                log_call_event("TWILIO_EVENT", f"Received event: {event_type}")
+                
+                if event_type == "connected":
+                    log_call_event("STREAM_CONNECTED", "Stream connected successfully")
+                
+                elif event_type == "start":
+                    self.stream_sid = data["start"]["streamSid"]
+                    self.envelope = MediaEnvelope(self.stream_sid)
+                    self.call_sid = data["start"].get("callSid")
+                    self.call_variables = data["start"].get("customParameters", {})
+                    self.template = get_template(self.call_variables.get("persona"))
+                    call_store.update(self.call_sid, "stream_started", stream_sid=self.stream_sid,
+                                      variables=self.call_variables)
+                    log_call_event("STREAM_STARTED", f"Stream started with SID: {self.stream_sid}")
+                    if self.call_variables:
+                        log_call_event("CALL_VARIABLES", f"Dynamic variables: {self.call_variables}", self.stream_sid)
+                    
+                    # Initial greeting is synthesized by the dialog worker
+                    queue_put_latest(self.dialog, ("say", INITIAL_GREETING))
+                
+                elif event_type == "media":
+                    # Media in an unexpected layout that the fast path passed on
+                    media = data["media"]
+                    self.handle_media(media.get("track", "inbound"), base64.b64decode(media["payload"]))
+                
+                elif event_type == "mark":
+                    self.mark_played(data["mark"]["name"])
+                
+                elif event_type == "stop":
+                    log_call_event("STREAM_STOPPED", "Stream stopped by Twilio")
+                    return
+                
+                else:
+                    log_call_event("UNKNOWN_EVENT", f"Unknown event type: {event_type}")
+                    
+            except asyncio.TimeoutError:
+                continue  # No message received, continue loop
+            except WebSocketDisconnect:
+                log_call_event("WEBSOCKET_DISCONNECTED", "Twilio closed the media stream")
+                return
+            except Exception as e:
+                log_call_event("MESSAGE_ERROR", f"Error processing message: {str(e)}")
+                logger.error(f"Error processing message: {e}")
+
+    def handle_media(self, track, audio):
+        """Route one media frame by track: caller audio to STT, bot audio is only counted"""
+        self.last_audio_time = time.time()
+        self.track_frames[track] = self.track_frames.get(track, 0) + 1
+        log_call_event("MEDIA_RECEIVED", f"Media event received - Track: {track}, audio length: {len(audio)} bytes")
+        
+        if track != "inbound":
+            # Our own voice played back; transcribing it would start spurious turns
+            return
+        
+        # Drop the oldest frame rather than stall the reader if STT falls behind
+        if self.stt_audio.full():
+            log_call_event("STT_QUEUE_OVERFLOW", "STT audio queue full, dropping oldest frame", self.stream_sid)
+        queue_put_latest(self.stt_audio, audio)
+
+    async def stt_sender(self):
+        """Convert queued caller audio, run VAD and stream speech to AssemblyAI.
+
+        With VAD_GATING on, silence is held back: the last VAD_PREROLL_FRAMES
+        frames are kept so the start of speech is not clipped, and one
+        STT_CHUNK_MS chunk of silence goes out every VAD_KEEPALIVE_MS to keep
+        the session alive.
+        """
+        loop = asyncio.get_running_loop()
+        preroll = deque(maxlen=VAD_PREROLL_FRAMES)
+        last_sent = loop.time()
+        while True:
+            audio = await self.stt_audio.get()
+            
+            # Convert μ-law 8k to PCM16 16k for AssemblyAI
+            pcm16, vad_event = await self.bridge.process_inbound_batched(audio, transcoder)
+            if vad_event:
+                log_call_event("VAD_EVENT", f"Local VAD: {vad_event}", self.stream_sid)
+                queue_put_latest(self.stt_events, (vad_event, ""))
+            
+            if not VAD_GATING or self.bridge.vad.speaking or vad_event == "speech_end":
+                while preroll:
+                    await self.stt_uplink.send(preroll.popleft())
+                    self.stt_frames_sent += 1
+                await self.stt_uplink.send(pcm16)
+                self.stt_frames_sent += 1
+                last_sent = loop.time()
+                if vad_event == "speech_end":
+                    # Don't hold the tail of the utterance back for a full chunk
+                    await self.stt_uplink.flush()
+                    if VAD_GATING:
+                        await stt_force_endpoint(self.ws_stt)
+            elif loop.time() - last_sent >= VAD_KEEPALIVE_MS / 1000:
+                # Held pre-roll predates the keepalive; sending it later would reorder audio
+                self.stt_frames_gated += len(preroll)
+                preroll.clear()
+                await self.stt_uplink.keepalive()
+                preroll.append(pcm16)
+                last_sent = loop.time()
+            else:
+                if len(preroll) == preroll.maxlen:
+                    self.stt_frames_gated += 1
+                preroll.append(pcm16)
+            
+            if self.bridge.vad.speech_frames == BARGE_IN_FRAMES:
+                await self.barge_in("vad")
+
+    async def turn_detector(self):
+        """Group STT finals into caller utterances and hand each one to the dialog.
+
+        An utterance ends once a final transcript has been followed by
+        END_OF_UTTERANCE_MS without further speech, independent of how often
+        media frames arrive. With SPECULATIVE_LLM, every final and every
+        partial that repeats unchanged starts an early LLM request for the
+        text so far; it is used if the finished utterance matches it.
+        """
+        pending = []
+        last_partial, repeats = "", 0
+        while True:
+            timeout = END_OF_UTTERANCE_MS / 1000 if pending else None
+            try:
+                kind, text = await asyncio.wait_for(self.stt_events.get(), timeout)
+            except asyncio.TimeoutError:
+                user_text = " ".join(pending)
+                pending.clear()
+                log_call_event("STT_UTTERANCE", f"Caller utterance complete: '{user_text}'", self.stream_sid)
+                queue_put_latest(self.dialog, self.commit_speculation(user_text))
+                continue
+            
+            if kind == "final":
+                pending.append(text)
+                last_partial, repeats = "", 0
+                self.speculate(" ".join(pending))
+            elif kind == "partial":
+                if len(text.split()) >= BARGE_IN_MIN_WORDS:
+                    await self.barge_in("stt_partial")
+                normalized = normalize(text)
+                repeats = repeats + 1 if normalized == last_partial else 1
+                last_partial = normalized
+                if repeats == SPECULATION_STABLE_PARTIALS and len(normalized.split()) >= SPECULATION_MIN_WORDS:
+                    self.speculate(" ".join(pending + [text]))
+            # Partials and VAD events mean the caller is still around; the wait restarts
+
+    def speculate(self, text):
+        """Start an early LLM request for text, replacing a speculation that no longer fits"""
+        if not (SPECULATIVE_LLM and LLM_STREAMING):
+            return
+        if self.speculation is not None:
+            if self.speculation.matches(text):
+                return
+            self.drop_speculation()
+        # History must include the previous turn, so wait for it to wind down
+        if self.turn_task is not None and not self.turn_task.done():
+            return
+        prompt_tokens = self.memory.tokens + estimate_tokens(self.template.system_prompt)
+        self.speculation = Speculation(
+            text, lambda t: llm_respond_stream(t, self.memory, self.template), prompt_tokens)
+        self.speculation_stats.started += 1
+        log_call_event("SPECULATION_STARTED", f"Speculative LLM request for: '{text[:50]}'", self.stream_sid)
+
+    def drop_speculation(self):
+        self.speculation.cancel()
+        self.speculation_stats.misses += 1
+        self.speculation_stats.wasted_tokens += self.speculation.wasted_tokens()
+        self.speculation = None
+
+    def commit_speculation(self, user_text):
+        """Dialog item for a finished utterance: the running speculation if it matches"""
+        speculation, self.speculation = self.speculation, None
+        if speculation is not None and speculation.matches(user_text):
+            self.speculation_stats.hits += 1
+            log_call_event("SPECULATION_HIT", f"Using speculative reply for: '{user_text[:50]}'", self.stream_sid)
+            return ("user", user_text, speculation)
+        if speculation is not None:
+            self.speculation = speculation
+            self.drop_speculation()
+        return ("user", user_text, None)
+
+    async def synthesize(self, text, output_format):
+        """Yield audio for text in output_format, streamed when the provider allows it"""
+        if output_format.provider == "retell":
+            yield await retell_tts_synthesize(text)
+        elif TTS_STREAMING:
+            async for chunk in tts_synthesize_stream(text, output_format):
+                yield chunk
+        else:
+            yield await tts_synthesize(text, output_format)
+
+    async def speak(self, text):
+        """Synthesize text and queue its 20 ms μ-law frames for playout as they are produced"""
+        output_format = tts_format()
+        key = tts_cache_key(text, output_format)
+        cached = await tts_cache.get(key)
+        if cached is not None:
+            for frame in chunk_ulaw(cached):
+                await self.outbound.put(frame)
+            await self.queue_mark()
+            log_call_event("TTS_CACHE_HIT", f"Cached audio queued: '{text[:50]}...'", self.stream_sid)
+            return
+        
+        framer = UlawFramer()
+        rendered = []
+        odd_byte = b""
+        async for chunk in self.synthesize(text, output_format):
+            if output_format.native_ulaw:
+                # Provider already speaks Twilio's wire format: frame it as is
+                ulaw8k = chunk
+            else:
+                # Conversion works on whole 16-bit samples; carry a split sample over
+                chunk = odd_byte + chunk
+                usable = len(chunk) - len(chunk) % 2
+                odd_byte = chunk[usable:]
+                
+                # Convert PCM16 16k to μ-law 8k
+                ulaw8k = await self.bridge.pcm16_16k_to_ulaw8k_batched(chunk[:usable], transcoder)
+            rendered.append(ulaw8k)
+            for frame in framer.feed(ulaw8k):
+                await self.outbound.put(frame)
+        for frame in framer.flush():
+            await self.outbound.put(frame)
+        await self.queue_mark()
+        await tts_cache.put(key, b"".join(rendered), persist=text in KNOWN_PROMPTS)
+        log_call_event("BOT_RESPONSE_QUEUED", f"Bot response queued: '{text[:50]}...'", self.stream_sid)
+
+    async def speak_segment(self, segments, text):
+        """speak(), noting where the segment's audio sits in the outbound stream"""
+        start = self.outbound.frames_queued
+        complete = False
+        try:
+            await self.speak(text)
+            complete = True
+        finally:
+            # A segment cut off mid-synthesis has no known length; estimate it from its words
+            end = self.outbound.frames_queued if complete else start + speech_frames(text)
+            segments.append((text, start, end))
+
+    async def bot_reply(self, kind, text, speculation=None):
+        """Produce one bot turn: a fixed line or an LLM answer to the caller"""
+        spoken = self.turn_segments = []
+        self.heard_until = None
+        try:
+            if kind == "say":
+                await self.speak_segment(spoken, text)
+            elif speculation is not None:
+                # The reply was started early; play what it has and follow the rest
+                async for segment in speculation.replay():
+                    await self.speak_segment(spoken, segment)
+            elif LLM_STREAMING:
+                # Each sentence goes to TTS while the model keeps generating
+                async for segment in llm_respond_stream(text, self.memory, self.template):
+                    await self.speak_segment(spoken, segment)
+            else:
+                reply = await llm_respond(text, self.memory, self.template)
+                await self.speak_segment(spoken, reply)
+        except Exception as e:
+            log_call_event("DIALOG_ERROR", f"Failed to produce bot turn: {str(e)}", self.stream_sid)
+            logger.error(f"Failed to produce bot turn: {e}")
+        except asyncio.CancelledError:
+            if speculation is not None:
+                speculation.cancel()
+            raise
+        finally:
+            # Runs on barge-in too, so history holds only what the caller heard
+            said = heard_text(spoken, self.heard_until)
+            if kind == "say":
+                self.memory.add("assistant", said)
+            else:
+                self.memory.add_exchange(text, said)
+
+    async def dialog_worker(self):
+        """Turn transcripts into bot speech, one turn at a time"""
+        while True:
+            kind, text, *speculation = await self.dialog.get()
+            # The turn runs as its own task so barge-in can cancel it
+            self.bot_turn = self.turn_task = asyncio.create_task(self.bot_reply(kind, text, *speculation))
+            await asyncio.wait([self.bot_turn])
+
+    @property
+    def bot_speaking(self):
+        """True while a bot turn is being generated, queued, or still playing at Twilio"""
+        generating = self.bot_turn is not None and not self.bot_turn.done()
+        return generating or self.outbound.depth > 0 or bool(self.marks)
+
+    async def queue_mark(self):
+        """Mark the end of the audio queued so far, to learn when it has played"""
+        self.mark_seq += 1
+        await self.outbound.put_mark(f"utt-{self.mark_seq}")
+
+    async def send_mark(self, name):
+        """Playout callback: the audio before this mark has been sent"""
+        if not self.stream_sid:
+            return
+        self.marks[name] = self.outbound.frames_sent
+        await twilio_send_mark(self.websocket, self.stream_sid, name)
+
+    def played_position(self):
+        """Outbound frame position the caller has heard up to.
+
+        Echoed marks confirm playback at segment ends; in between, frames are
+        sent at real-time pace, so everything but the prefill lead has played.
+        """
+        return max(self.frames_played, self.outbound.frames_sent - self.outbound.lead_frames)
+
+    def mark_played(self, name):
+        """Twilio echoed a mark: everything sent before it has played"""
+        sent = self.marks.pop(name, None)
+        if sent is None:
+            return  # dropped by a barge-in
+        self.frames_played = sent
+        log_call_event("PLAYBACK_MARK", f"Played up to {name} ({sent * 20} ms of bot audio)", self.stream_sid)
+
+    async def barge_in(self, reason):
+        """Caller started talking over the bot: stop the turn and drop its audio"""
+        if not BARGE_IN_ENABLED or not self.bot_speaking:
+            return
+        self.barge_ins += 1
+        played = self.played_position()
+        if self.bot_turn is not None and not self.bot_turn.done():
+            # The turn records its own history when the cancellation lands
+            self.heard_until = played
+            self.bot_turn.cancel()
+        elif self.turn_segments:
+            # Fully generated but still playing: cut the recorded reply back
+            self.memory.replace_last("assistant", heard_text(self.turn_segments, played))
+            self.turn_segments = []
+        self.bot_turn = None
+        dropped = self.outbound.flush()
+        self.marks.clear()  # Twilio echoes them on clear, but none of that audio plays
+        if self.stream_sid:
+            await twilio_send_clear(self.websocket, self.stream_sid)
+        log_call_event("BARGE_IN", f"Caller interrupted bot ({reason}), dropped {dropped} queued frames", self.stream_sid)
+
+    async def send_frame(self, frame):
+        """Playout callback: send one media message of μ-law audio to Twilio"""
+        if not self.stream_sid:
+            log_call_event("STREAM_SID_MISSING", "Cannot send audio: stream_sid is None")
+            return
+        await twilio_send_audio(self.websocket, frame, self.stream_sid, self.envelope)
+
 @app.websocket("/stream")
 async def stream_socket(websocket: WebSocket):
     """WebSocket endpoint for Twilio Media Streams"""
@@ -417,116 +1497,19 @@ async def stream_socket(websocket: WebSocket):
         await websocket.close(code=4003, reason="Invalid token")
         return
     
-    # Initialize variables
     ws_stt = None
-    stream_sid = None
-    last_audio_time = time.time()
-    media_timeout = 30  # 30 seconds timeout for media events
-    bridge = AudioBridge()  # Audio conversion bridge
     
     try:
-        # Connect to STT service
-        ws_stt = await stt_connect()
-        log_call_event("STT_READY", "STT service connected and ready")
+        # Use the STT session opened while the phone rang, if it is still up
+        ws_stt = await prewarmer.claim(decoded.get("call_sid"))
+        if ws_stt is not None and ws_stt.open:
+            log_call_event("STT_READY", "Pre-warmed STT session attached", decoded.get("call_sid"))
+        else:
+            ws_stt = await stt_checkout()
+            log_call_event("STT_READY", "STT service connected and ready")
         
-        # Main message loop
-        while True:
-            try:
-                # Check for media timeout
-                if time.time() - last_audio_time > media_timeout:
-                    log_call_event("MEDIA_TIMEOUT", f"No media events for {media_timeout} seconds, closing connection")
-                    break
-                
-                # Receive message from Twilio
-                msg = await asyncio.wait_for(websocket.receive_text(), timeout=1.0)
-                data = json.loads(msg)
-                event_type = data.get("event")
-                
-                log_call_event("TWILIO_EVENT", f"Received event: {event_type}")
-                
-                if event_type == "connected":
-                    log_call_event("STREAM_CONNECTED", "Stream connected successfully")
-                    continue
-                
-                elif event_type == "start":
-                    stream_sid = data["start"]["streamSid"]
-                    log_call_event("STREAM_STARTED", f"Stream started with SID: {stream_sid}")
-                    
-                    # Send initial greeting via TTS
-                    try:
-                        initial_greeting = "Merhaba, ben su arıtma cihazınızın bakım asistanıyım. Size nasıl yardımcı olabilirim?"
-                        pcm_greeting = await tts_synthesize(initial_greeting)
-                        
-                        if stream_sid:
-                            ulaw8k_greeting = bridge.pcm16_16k_to_ulaw8k(pcm_greeting)
-                            for frame in chunk_ulaw(ulaw8k_greeting):
-                                await twilio_send_audio(websocket, frame, stream_sid)
-                                await asyncio.sleep(0.02)  # 20ms delay between frames
-                            log_call_event("INITIAL_GREETING_SENT", "Initial TTS greeting sent successfully")
-                        else:
-                            log_call_event("GREETING_ERROR", "Cannot send greeting: stream_sid is None")
-                    except Exception as e:
-                        log_call_event("GREETING_ERROR", f"Failed to send initial greeting: {str(e)}")
-                    
-                    continue
-                
-                elif event_type == "media":
-                    # Update audio timeout
-                    last_audio_time = time.time()
-                    
-                    audio_b64 = data["media"]["payload"]
-                    audio = base64.b64decode(audio_b64)
-                    
-                    log_call_event("MEDIA_RECEIVED", f"Media event received - Audio length: {len(audio)} bytes")
-                    
-                    # Convert μ-law 8k to PCM16 16k for AssemblyAI
-                    pcm16 = bridge.ulaw8k_to_pcm16_16k(audio)
-                    await stt_send_audio(ws_stt, pcm16)
-                    
-                    # Check for STT responses
-                    try:
-                        while True:
-                            stt_msg = await asyncio.wait_for(stt_recv(ws_stt), timeout=0.1)
-                            if stt_msg and stt_msg.get("message_type") in ("FinalTranscript", "final"):
-                                user_text = stt_msg.get("text", "").strip()
-                                if user_text:
-                                    log_call_event("STT_FINAL", f"STT final transcript: '{user_text}'")
-                                    
-                                    # Get LLM response
-                                    bot_response = await llm_respond(user_text)
-                                    
-                                    # Synthesize speech
-                                    if os.getenv("USE_RETELL_TTS") == "1":
-                                        pcm_bot = await retell_tts_synthesize(bot_response)
-                                    else:
-                                        pcm_bot = await tts_synthesize(bot_response)
-                                    
-                                    # Convert PCM16 16k to μ-law 8k and send in 20ms frames
-                                    if stream_sid:
-                                        ulaw8k = bridge.pcm16_16k_to_ulaw8k(pcm_bot)
-                                        for frame in chunk_ulaw(ulaw8k):
-                                            await twilio_send_audio(websocket, frame, stream_sid)
-                                            await asyncio.sleep(0.02)  # 20ms delay between frames
-                                        log_call_event("BOT_RESPONSE_SENT", f"Bot response sent: '{bot_response[:50]}...'")
-                                    else:
-                                        log_call_event("STREAM_SID_MISSING", "Cannot send audio: stream_sid is None")
-                                break
-                    except asyncio.TimeoutError:
-                        pass  # No STT response within timeout
-                
-                elif event_type == "stop":
-                    log_call_event("STREAM_STOPPED", "Stream stopped by Twilio")
-                    break
-                
-                else:
-                    log_call_event("UNKNOWN_EVENT", f"Unknown event type: {event_type}")
-                    
-            except asyncio.TimeoutError:
-                continue  # No message received, continue loop
-            except Exception as e:
-                log_call_event("MESSAGE_ERROR", f"Error processing message: {str(e)}")
-                logger.error(f"Error processing message: {e}")
-                continue
+        pipeline = CallPipeline(websocket, ws_stt)
+        await pipeline.run()
     
     except Exception as e:
         log_call_event("WEBSOCKET_ERROR", f"WebSocket error: {str(e)}")
@@ -543,7 +1526,10 @@ async def stream_socket(websocket: WebSocket):
         
         call_duration = time.time() - call_start_time
         log_call_event("WEBSOCKET_CLOSED", f"WebSocket connection closed after {call_duration:.2f} seconds")
-        await websocket.close()
+        try:
+            await websocket.close()
+        except:
+            pass
 
 if __name__ == "__main__":
     import uvicorn
@@ -564,21 +1550,21 @@ async def retell_tts_synthesize(text) -> bytes:
             "text": text,
             "voice": "tr-TR-EmelNeural",
             "language": "tr-TR",
-            "output_format": "pcm_16k"
+            "output_format": RETELL_TTS_FORMAT.name
         }
         
-        async with httpx.AsyncClient(timeout=60) as client:
-            r = await client.post(url, headers=headers, json=payload)
-            r.raise_for_status()
-            
-            audio_bytes = r.content
-            log_call_event("RETELL_TTS_SUCCESS", f"Retell TTS successful, received {len(audio_bytes)} bytes of audio")
-            
-            return audio_bytes
+        client = get_client("retell")
+        r = await client.post(url, headers=headers, json=payload)
+        r.raise_for_status()
+        
+        audio_bytes = r.content
+        log_call_event("RETELL_TTS_SUCCESS", f"Retell TTS successful, received {len(audio_bytes)} bytes of audio")
+        
+        return audio_bytes
             
     except Exception as e:
         log_call_event("RETELL_TTS_ERROR", f"Retell TTS synthesis failed: {str(e)}")
         logger.error(f"Retell TTS synthesis failed: {e}")
-        # Fallback to Azure TTS
-        return await tts_synthesize(text)
+        # Fallback to Azure TTS, in the PCM the caller expects from Retell
+        return await tts_synthesize(text, AZURE_PCM_FORMAT)
 
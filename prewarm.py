@@ -0,0 +1,131 @@
+"""
+Call pre-warming - open per-call upstream sessions while the phone is still ringing
+"""
+import os
+import asyncio
+import logging
+import time
+from call_logger import log_call_event
+from stt_pool import STT_POOL_MAX_AGE_S
+
+logger = logging.getLogger(__name__)
+
+PREWARM_TTL_S = float(os.getenv("PREWARM_TTL_S", "90"))  # drop resources of calls never answered
+
+class PrewarmedCall:
+    def __init__(self, call_sid):
+        self.call_sid = call_sid
+        self.created = time.monotonic()
+        self.stt = None  # stt_pool.PooledSession
+        self.stt_task = None
+        self.shared_task = None
+        self.expiry = None
+
+class CallPrewarmer:
+    """Per-call resources prepared between dialing and the media stream connecting.
+
+    ``start`` runs ``open_stt`` and ``warm_shared`` for a Call SID as two
+    background tasks; ``claim`` hands the STT session to the stream, waiting
+    only for a connect that is still in flight, never for ``warm_shared``.
+    A session that has been open for ``max_age_s`` (the STT idle limit the
+    pool also honours) is closed instead of handed out. Entries nobody claims
+    within ``ttl_s`` are torn down with ``close_stt``.
+    """
+
+    def __init__(self, open_stt, close_stt, warm_shared, ttl_s=PREWARM_TTL_S, max_age_s=STT_POOL_MAX_AGE_S):
+        self.open_stt = open_stt        # async () -> stt_pool.PooledSession
+        self.close_stt = close_stt      # async (websocket) -> None
+        self.warm_shared = warm_shared  # async () -> None: pools, greeting audio
+        self.ttl_s = ttl_s
+        self.max_age_s = max_age_s
+        self.calls = {}
+        self.background = set()  # warm_shared tasks left running after a claim, stale session closes
+        self.claimed = 0
+        self.stale = 0
+        self.expired = 0
+
+    def start(self, call_sid):
+        if not call_sid or call_sid in self.calls:
+            return
+        entry = PrewarmedCall(call_sid)
+        entry.stt_task = asyncio.create_task(self._open_stt(entry), name=f"prewarm-stt:{call_sid}")
+        entry.shared_task = asyncio.create_task(self._warm_shared(entry), name=f"prewarm-shared:{call_sid}")
+        self._track(entry.shared_task)
+        entry.expiry = asyncio.get_running_loop().call_later(self.ttl_s, self._expire, call_sid)
+        self.calls[call_sid] = entry
+        log_call_event("PREWARM_STARTED", "Pre-warming call resources while ringing", call_sid)
+
+    async def _open_stt(self, entry):
+        try:
+            entry.stt = await self.open_stt()
+        except Exception as e:
+            log_call_event("PREWARM_ERROR", f"STT pre-connect failed: {str(e)}", entry.call_sid)
+            return
+        log_call_event("PREWARM_READY", f"STT session ready in {time.monotonic() - entry.created:.2f}s", entry.call_sid)
+
+    async def _warm_shared(self, entry):
+        try:
+            await self.warm_shared()
+        except Exception as e:
+            log_call_event("PREWARM_ERROR", f"Shared warm-up failed: {str(e)}", entry.call_sid)
+
+    def _track(self, task):
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    async def claim(self, call_sid):
+        """Take the pre-connected STT websocket for a call, or None"""
+        entry = self.calls.pop(call_sid, None) if call_sid else None
+        if entry is None:
+            return None
+        entry.expiry.cancel()
+        try:
+            await entry.stt_task
+        except asyncio.CancelledError:
+            return None
+        session = entry.stt
+        if session is None:
+            return None
+        age = time.monotonic() - session.opened
+        if age >= self.max_age_s:
+            # Near the provider's idle limit it would drop early in the call
+            self.stale += 1
+            log_call_event("PREWARM_STALE", f"Pre-warmed STT session is {age:.0f}s old, not using it", call_sid)
+            self._track(asyncio.create_task(self._close(session)))
+            return None
+        self.claimed += 1
+        return session.ws
+
+    def _expire(self, call_sid):
+        entry = self.calls.pop(call_sid, None)
+        if entry is None:
+            return
+        self.expired += 1
+        log_call_event("PREWARM_EXPIRED", f"Call not answered within {self.ttl_s:.0f}s, releasing resources", call_sid)
+        asyncio.create_task(self._release(entry))
+
+    async def _release(self, entry):
+        entry.stt_task.cancel()
+        entry.shared_task.cancel()
+        await asyncio.gather(entry.stt_task, entry.shared_task, return_exceptions=True)
+        if entry.stt is not None:
+            await self._close(entry.stt)
+
+    async def _close(self, session):
+        try:
+            await self.close_stt(session.ws)
+        except Exception as e:
+            logger.warning(f"Closing pre-warmed STT session failed: {e}")
+
+    async def aclose(self):
+        entries = list(self.calls.values())
+        self.calls.clear()
+        for entry in entries:
+            entry.expiry.cancel()
+        await asyncio.gather(*(self._release(entry) for entry in entries), return_exceptions=True)
+        for task in list(self.background):
+            task.cancel()
+        await asyncio.gather(*self.background, return_exceptions=True)
+
+    def stats(self):
+        return {"pending": len(self.calls), "claimed": self.claimed, "expired": self.expired, "stale": self.stale}
@@ -0,0 +1,97 @@
+"""
+Prompt templates - per-persona system prompts and pre-serialized chat completion bodies
+"""
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "150"))
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.4"))
+DEFAULT_PERSONA = os.getenv("DEFAULT_PERSONA", "bakim")
+
+PERSONAS = {
+    "bakim": """Rolün: Su arıtma cihazı bakım danışmanı.
+Türkçe, nazik, 2-3 cümlelik yanıtlar ver.
+KVKK'ya uygun davran.
+"Hayır, istemiyorum" diyenlere ısrar etme.
+Hedefler: (1) Uygun zaman teyidi, (2) Filtre-bakım ihtiyacı, (3) Randevu, (4) WhatsApp bilgi.
+Kaçın: Uzun konuşma, teknik detaya boğma, fiyatı net sormadan söyleme.
+Duygular: Sakin, çözüm odaklı, saygılı.""",
+}
+
+def encode_message(message):
+    """One chat message as compact JSON, ready to splice into a request body"""
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+class PromptTemplate:
+    """Request body for one persona with everything that never changes rendered once.
+
+    The model settings and the system message are serialized at construction;
+    a turn only appends the already-encoded history and the new user message.
+    The system prompt is always the first message and the history keeps its
+    order, so consecutive requests share a long identical prefix and hit the
+    provider's prompt cache.
+    """
+
+    def __init__(self, persona, system_prompt, model=LLM_MODEL, max_tokens=LLM_MAX_TOKENS,
+                 temperature=LLM_TEMPERATURE):
+        self.persona = persona
+        self.system_prompt = system_prompt
+        self.system_message = {"role": "system", "content": system_prompt}
+        settings = {"model": model, "max_tokens": max_tokens, "temperature": temperature}
+        head = json.dumps(settings, separators=(",", ":"))[:-1]
+        messages = ',"messages":[' + encode_message(self.system_message)
+        self._prefix = head + messages
+        self._stream_prefix = head + ',"stream":true,"stream_options":{"include_usage":true}' + messages
+
+    def body(self, encoded_history, user_content, stream=False) -> bytes:
+        """UTF-8 JSON body: system prompt, encoded history messages, then the new user turn"""
+        parts = [self._stream_prefix if stream else self._prefix]
+        parts.extend(encoded_history)
+        parts.append(encode_message({"role": "user", "content": user_content}))
+        return (",".join(parts) + "]}").encode("utf-8")
+
+_templates = {}
+
+def get_template(persona=None) -> PromptTemplate:
+    """Compiled template for a persona (unknown names fall back to the default)"""
+    if persona not in PERSONAS:
+        persona = DEFAULT_PERSONA
+    template = _templates.get(persona)
+    if template is None:
+        template = _templates[persona] = PromptTemplate(persona, PERSONAS[persona])
+    return template
+
+class UsageStats:
+    """Running token totals from API responses, including prompt-cache hits"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, usage):
+        """Add one response's ``usage`` object; returns (prompt, cached, completion) tokens"""
+        if not usage:
+            return 0, 0, 0
+        prompt = usage.get("prompt_tokens", 0)
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        completion = usage.get("completion_tokens", 0)
+        self.requests += 1
+        self.prompt_tokens += prompt
+        self.cached_tokens += cached
+        self.completion_tokens += completion
+        return prompt, cached, completion
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cache_hit_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0,
+            "completion_tokens": self.completion_tokens,
+        }
@@ -2,9 +2,8 @@
 """
 Retell.ai Doğru Entegrasyonu - Türkiye Arama
 """
-import asyncio
 import os
-import httpx
+from http_clients import get_client, run_with_clients
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -38,20 +37,20 @@ class RetellAIIntegration:
             print(f"📞 To: {to_number}")
             print(f"🤖 Agent ID: {self.agent_id}")
             
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.post(url, headers=headers, json=payload)
+            client = get_client("retell")
+            response = await client.post(url, headers=headers, json=payload)
+            
+            if response.status_code == 200:
+                result = response.json()
+                print(f"✅ Arama başarıyla başlatıldı!")
+                print(f"📋 Call ID: {result.get('call_id', 'N/A')}")
+                print(f"📊 Status: {result.get('status', 'N/A')}")
+                return result
+            else:
+                print(f"❌ Hata: {response.status_code}")
+                print(f"📝 Response: {response.text}")
+                return None
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    print(f"✅ Arama başarıyla başlatıldı!")
-                    print(f"📋 Call ID: {result.get('call_id', 'N/A')}")
-                    print(f"📊 Status: {result.get('status', 'N/A')}")
-                    return result
-                else:
-                    print(f"❌ Hata: {response.status_code}")
-                    print(f"📝 Response: {response.text}")
-                    return None
-                    
         except Exception as e:
             print(f"❌ Exception: {str(e)}")
             return None
@@ -103,4 +102,4 @@ async def test_retell_call():
         return False
 
 if __name__ == "__main__":
-    asyncio.run(test_retell_call())
+    run_with_clients(test_retell_call())
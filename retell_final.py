@@ -4,7 +4,7 @@ Retell.ai Final Entegrasyonu - Doğal Akış
 """
 import asyncio
 import os
-import httpx
+from http_clients import get_client, run_with_clients
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -38,18 +38,18 @@ class RetellAIIntegration:
             print(f"📊 To: {to_number}")
             print(f"📊 Agent ID: {self.agent_id}")
             
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.post(url, headers=headers, json=payload)
-                
-                print(f"📊 Status Code: {response.status_code}")
-                print(f"📄 Response: {response.text}")
+            client = get_client("retell")
+            response = await client.post(url, headers=headers, json=payload)
+            
+            print(f"📊 Status Code: {response.status_code}")
+            print(f"📄 Response: {response.text}")
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                print(f"❌ Retell.ai hatası: {response.status_code}")
+                return None
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    print(f"❌ Retell.ai hatası: {response.status_code}")
-                    return None
-                    
         except Exception as e:
             print(f"❌ Retell.ai entegrasyon hatası: {e}")
             return None
@@ -63,14 +63,14 @@ class RetellAIIntegration:
                 "Content-Type": "application/json"
             }
             
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.get(url, headers=headers)
+            client = get_client("retell")
+            response = await client.get(url, headers=headers)
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return None
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return None
-                    
         except Exception as e:
             print(f"❌ Call status hatası: {e}")
             return None
@@ -140,4 +140,4 @@ async def main():
         print("🔧 API key'i kontrol edin")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_with_clients(main())
@@ -4,7 +4,7 @@ Retell.ai Entegrasyonu - Doğal Akış
 """
 import asyncio
 import os
-import httpx
+from http_clients import get_client, run_with_clients
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -31,16 +31,16 @@ class RetellAIIntegration:
                 "retell_llm_dynamic_variables": dynamic_variables or {}
             }
             
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.post(url, headers=headers, json=payload)
+            client = get_client("retell")
+            response = await client.post(url, headers=headers, json=payload)
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                print(f"❌ Retell.ai hatası: {response.status_code}")
+                print(f"📄 Hata detayı: {response.text}")
+                return None
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    print(f"❌ Retell.ai hatası: {response.status_code}")
-                    print(f"📄 Hata detayı: {response.text}")
-                    return None
-                    
         except Exception as e:
             print(f"❌ Retell.ai entegrasyon hatası: {e}")
             return None
@@ -54,14 +54,14 @@ class RetellAIIntegration:
                 "Content-Type": "application/json"
             }
             
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.get(url, headers=headers)
+            client = get_client("retell")
+            response = await client.get(url, headers=headers)
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return None
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return None
-                    
         except Exception as e:
             print(f"❌ Call status hatası: {e}")
             return None
@@ -133,4 +133,4 @@ async def main():
         print("🔧 Agent ID ve API key'i kontrol edin")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_with_clients(main())
@@ -0,0 +1,89 @@
+"""
+Speculative LLM turns - start generating a reply before the caller's utterance is final
+"""
+import os
+import re
+import asyncio
+from difflib import SequenceMatcher
+from conversation_memory import estimate_tokens
+
+SPECULATION_MATCH_RATIO = float(os.getenv("SPECULATION_MATCH_RATIO", "0.9"))  # final vs guessed text
+SPECULATION_STABLE_PARTIALS = int(os.getenv("SPECULATION_STABLE_PARTIALS", "2"))  # identical partials in a row
+SPECULATION_MIN_WORDS = int(os.getenv("SPECULATION_MIN_WORDS", "2"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+def normalize(text):
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+def similarity(a, b):
+    """0..1 closeness of two transcripts, ignoring case and punctuation"""
+    a, b = normalize(a), normalize(b)
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+class Speculation:
+    """One early LLM request for a guessed utterance.
+
+    Segments are buffered as they arrive. ``replay`` yields the buffered ones
+    and then follows the live stream, so a committed speculation plays as if
+    the request had been made at end of utterance, only sooner.
+    """
+
+    def __init__(self, text, generate, prompt_tokens=0):
+        self.text = text
+        self.prompt_tokens = prompt_tokens  # estimate of the system prompt and history sent with it
+        self.segments = []
+        self.done = False
+        self.updated = asyncio.Event()
+        self.task = asyncio.create_task(self._run(generate))
+
+    async def _run(self, generate):
+        try:
+            async for segment in generate(self.text):
+                self.segments.append(segment)
+                self.updated.set()
+        finally:
+            self.done = True
+            self.updated.set()
+
+    async def replay(self):
+        sent = 0
+        while True:
+            while sent < len(self.segments):
+                yield self.segments[sent]
+                sent += 1
+            if self.done:
+                return
+            self.updated.clear()
+            if sent == len(self.segments) and not self.done:
+                await self.updated.wait()
+
+    def matches(self, text, ratio=SPECULATION_MATCH_RATIO):
+        return similarity(self.text, text) >= ratio
+
+    def cancel(self):
+        self.task.cancel()
+
+    def wasted_tokens(self):
+        """Estimated tokens spent on a speculation that was thrown away"""
+        generated = sum(estimate_tokens(s) for s in self.segments)
+        return self.prompt_tokens + estimate_tokens(self.text) + generated
+
+class SpeculationStats:
+    def __init__(self):
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted_tokens = 0
+
+    def stats(self):
+        decided = self.hits + self.misses
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / decided, 3) if decided else 0,
+            "wasted_tokens_est": self.wasted_tokens,
+        }
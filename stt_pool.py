@@ -0,0 +1,193 @@
+"""
+STT session pool - keeps connected, configured realtime sessions ready for new calls
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from call_logger import log_call_event
+
+logger = logging.getLogger(__name__)
+
+STT_POOL_MIN = int(os.getenv("STT_POOL_MIN", "1"))
+STT_POOL_MAX = int(os.getenv("STT_POOL_MAX", "8"))
+STT_POOL_MAX_AGE_S = float(os.getenv("STT_POOL_MAX_AGE_S", "45"))       # replace before provider idle limits
+STT_POOL_CHECK_INTERVAL_S = float(os.getenv("STT_POOL_CHECK_INTERVAL_S", "5"))
+STT_POOL_RATE_WINDOW_S = float(os.getenv("STT_POOL_RATE_WINDOW_S", "60"))  # arrival rate measurement
+
+class PooledSession:
+    __slots__ = ("ws", "opened")
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.opened = time.monotonic()
+
+class SttSessionPool:
+    """Per-process pool of idle STT sessions.
+
+    ``checkout`` hands out a ready session immediately, or connects on the
+    spot when the pool is empty. A background task closes sessions that died
+    or grew older than ``max_age_s``, pings the rest, and refills the pool.
+    The target size follows Little's law: recent call arrival rate times the
+    time a refill takes (plus one check interval), clamped to
+    ``min_size``..``max_size``.
+    """
+
+    def __init__(self, connect, min_size=STT_POOL_MIN, max_size=STT_POOL_MAX,
+                 max_age_s=STT_POOL_MAX_AGE_S, check_interval_s=STT_POOL_CHECK_INTERVAL_S,
+                 rate_window_s=STT_POOL_RATE_WINDOW_S):
+        self.connect = connect  # async () -> websocket, already configured
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.max_age_s = max_age_s
+        self.check_interval_s = check_interval_s
+        self.rate_window_s = rate_window_s
+        self.ready = deque()
+        self.connecting = 0
+        self.opening = set()
+        self.arrivals = deque()
+        self.connect_time_s = 1.0  # moving average of connect latency
+        self.failures = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.stopping = False
+        self.hits = 0
+        self.misses = 0
+        self.replaced = 0
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+        self.task = asyncio.create_task(self.run(), name="stt_pool")
+        logger.info(f"STT session pool started (min={self.min_size}, max={self.max_size})")
+
+    async def aclose(self):
+        if self.task is not None:
+            # The flag ends the loop even if a cancel gets swallowed by an inner wait
+            self.stopping = True
+            self.wakeup.set()
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for task in list(self.opening):
+            task.cancel()
+        await asyncio.gather(*self.opening, return_exceptions=True)
+        while self.ready:
+            await self._close(self.ready.popleft())
+
+    def arrival_rate(self):
+        """Checkouts per second over the measurement window"""
+        cutoff = time.monotonic() - self.rate_window_s
+        while self.arrivals and self.arrivals[0] < cutoff:
+            self.arrivals.popleft()
+        return len(self.arrivals) / self.rate_window_s
+
+    def target_size(self):
+        lead_time = self.connect_time_s + self.check_interval_s
+        wanted = math.ceil(self.arrival_rate() * lead_time)
+        return min(self.max_size, max(self.min_size, wanted))
+
+    def _usable(self, session):
+        return session.ws.open and time.monotonic() - session.opened < self.max_age_s
+
+    async def checkout(self):
+        """A connected session for a new call"""
+        return (await self.checkout_session()).ws
+
+    async def checkout_session(self):
+        """Like ``checkout``, but as a PooledSession so the caller can tell its age"""
+        self.arrivals.append(time.monotonic())
+        while self.ready:
+            session = self.ready.popleft()
+            if self._usable(session):
+                self.hits += 1
+                self.wakeup.set()
+                return session
+            await self._close(session)
+        self.misses += 1
+        self.wakeup.set()
+        return PooledSession(await self._connect())
+
+    async def _connect(self):
+        started = time.monotonic()
+        ws = await self.connect()
+        self.connect_time_s = 0.8 * self.connect_time_s + 0.2 * (time.monotonic() - started)
+        return ws
+
+    async def _close(self, session):
+        try:
+            await session.ws.close()
+        except Exception:
+            pass
+
+    async def _open_one(self):
+        try:
+            self.ready.append(PooledSession(await self._connect()))
+            self.failures = 0
+        except Exception as e:
+            self.failures += 1
+            log_call_event("STT_POOL_ERROR", f"Could not open pooled STT session: {str(e)}")
+        finally:
+            self.connecting -= 1
+
+    async def _healthy(self, session):
+        if not self._usable(session):
+            return False
+        try:
+            pong = await session.ws.ping()
+            await asyncio.wait_for(pong, timeout=2)
+            return True
+        except Exception:
+            return False
+
+    async def _check(self):
+        # Sessions stay available to checkout while they are being pinged
+        sessions = list(self.ready)
+        healthy = await asyncio.gather(*(self._healthy(s) for s in sessions))
+        for session, ok in zip(sessions, healthy):
+            if not ok and session in self.ready:
+                self.ready.remove(session)
+                self.replaced += 1
+                await self._close(session)
+
+    async def run(self):
+        while not self.stopping:
+            await self._check()
+            missing = self.target_size() - len(self.ready) - self.connecting
+            # Trim an oversized pool (arrivals slowed down); oldest sessions go first
+            while missing < 0 and self.ready:
+                await self._close(self.ready.popleft())
+                missing += 1
+            for _ in range(max(missing, 0)):
+                self.connecting += 1
+                task = asyncio.create_task(self._open_one())
+                self.opening.add(task)
+                task.add_done_callback(self.opening.discard)
+
+            # Back off while the provider keeps refusing connections
+            delay = self.check_interval_s * min(2 ** self.failures, 12)
+            self.wakeup.clear()
+            # Not wait_for: on 3.11 it can swallow a cancel that lands as the event is set
+            waiter = asyncio.ensure_future(self.wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=delay)
+            finally:
+                waiter.cancel()
+
+    def stats(self):
+        return {
+            "ready": len(self.ready),
+            "target": self.target_size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "replaced": self.replaced,
+            "arrivals_per_min": round(self.arrival_rate() * 60, 2),
+        }
@@ -0,0 +1,137 @@
+"""
+Batched transcoding engine - converts audio for all active calls once per tick
+"""
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import audio_codec as codec
+
+logger = logging.getLogger(__name__)
+
+TRANSCODE_TICK_MS = float(os.getenv("TRANSCODE_TICK_MS", "10"))
+TRANSCODE_THREADS = int(os.getenv("TRANSCODE_THREADS", "0"))  # 0 = convert on the event loop thread
+
+class TranscodeEngine:
+    """Collects pending frames from every call and converts each direction as one batch.
+
+    Callers pass their own resampler state (``audio_codec.Upsampler`` or
+    ``Downsampler``), so per-call filter history is preserved. A call may
+    have at most one frame per direction in a batch; extra frames wait for
+    the next tick to keep them in order. With TRANSCODE_THREADS > 0 the
+    batches run in a thread pool and the event loop only does socket I/O.
+    """
+
+    def __init__(self, tick_ms=TRANSCODE_TICK_MS, threads=TRANSCODE_THREADS):
+        self.tick_s = tick_ms / 1000
+        self.threads = threads
+        self.executor = None
+        self.inbound_pending = []   # (upsampler, ulaw bytes, future)
+        self.outbound_pending = []  # (downsampler, pcm16k bytes, future)
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.batches = 0
+        self.frames = 0
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if self.running:
+            return
+        if self.threads > 0:
+            self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="transcode")
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run(), name="transcoder")
+        logger.info(f"Transcode engine started (tick={self.tick_s * 1000:.0f} ms, threads={self.threads})")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for _, _, future in self.inbound_pending + self.outbound_pending:
+            if not future.done():
+                future.cancel()
+        self.inbound_pending, self.outbound_pending = [], []
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def _submit(self, pending, state, data):
+        future = asyncio.get_running_loop().create_future()
+        pending.append((state, data, future))
+        self.wakeup.set()
+        return future
+
+    async def inbound(self, upsampler, ulaw_bytes):
+        """μ-law 8k -> (PCM16 8k array, PCM16 16k bytes)"""
+        return await self._submit(self.inbound_pending, upsampler, ulaw_bytes)
+
+    async def outbound(self, downsampler, pcm16k_bytes):
+        """PCM16 16k -> μ-law 8k bytes"""
+        return await self._submit(self.outbound_pending, downsampler, pcm16k_bytes)
+
+    @staticmethod
+    def _take_batch(pending):
+        """Split off one entry per state; later entries for the same call wait"""
+        batch, rest, seen = [], [], set()
+        for item in pending:
+            state, _, future = item
+            if future.cancelled():
+                continue
+            if id(state) in seen:
+                rest.append(item)
+                continue
+            seen.add(id(state))
+            batch.append(item)
+        return batch, rest
+
+    @staticmethod
+    def _convert(inbound, outbound):
+        results_in = codec.ulaw8k_to_pcm16_16k_batch([s for s, _, _ in inbound], [d for _, d, _ in inbound]) if inbound else ([], [])
+        results_out = codec.pcm16_16k_to_ulaw8k_batch([s for s, _, _ in outbound], [d for _, d, _ in outbound]) if outbound else []
+        return results_in, results_out
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(self.tick_s)  # let the other calls' frames arrive
+            self.wakeup.clear()
+
+            inbound, self.inbound_pending = self._take_batch(self.inbound_pending)
+            outbound, self.outbound_pending = self._take_batch(self.outbound_pending)
+            if self.inbound_pending or self.outbound_pending:
+                self.wakeup.set()
+            if not inbound and not outbound:
+                continue
+
+            try:
+                if self.executor is not None:
+                    (pcm8k, pcm16k), ulaw = await loop.run_in_executor(self.executor, self._convert, inbound, outbound)
+                else:
+                    (pcm8k, pcm16k), ulaw = self._convert(inbound, outbound)
+            except Exception as e:
+                logger.error(f"Transcode batch failed: {e}")
+                for _, _, future in inbound + outbound:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for i, (_, _, future) in enumerate(inbound):
+                if not future.done():
+                    future.set_result((pcm8k[i], pcm16k[i]))
+            for i, (_, _, future) in enumerate(outbound):
+                if not future.done():
+                    future.set_result(ulaw[i])
+            self.batches += 1
+            self.frames += len(inbound) + len(outbound)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch": round(self.frames / self.batches, 1) if self.batches else 0,
+        }
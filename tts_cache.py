@@ -0,0 +1,88 @@
+"""
+TTS result cache - ready-to-send 8 kHz μ-law audio in memory (LRU) and on disk
+"""
+import os
+import asyncio
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_ITEMS = int(os.getenv("TTS_CACHE_MAX_ITEMS", "256"))
+
+def cache_key(text, voice, prosody, output_format):
+    """Stable key for one rendering of text"""
+    raw = "\x1f".join((text, voice, prosody, output_format))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class TTSCache:
+    """Two-tier cache of synthesized μ-law 8k audio.
+
+    The memory tier is a bounded LRU of every recent utterance; the disk tier
+    holds utterances stored with ``persist=True`` (fixed prompts) so they
+    survive restarts. Disk access runs in a worker thread.
+    """
+
+    def __init__(self, directory=TTS_CACHE_DIR, max_items=TTS_CACHE_MAX_ITEMS):
+        self.directory = directory
+        self.max_items = max_items
+        self._memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.ulaw")
+
+    def _remember(self, key, ulaw):
+        self._memory[key] = ulaw
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key, ulaw):
+        os.makedirs(self.directory, exist_ok=True)
+        # Unique per writer: two calls may persist the same prompt at once
+        tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(ulaw)
+        os.replace(tmp, self._path(key))
+
+    async def get(self, key):
+        """Cached μ-law bytes for key, or None"""
+        ulaw = self._memory.get(key)
+        if ulaw is None:
+            ulaw = await asyncio.to_thread(self._read, key)
+            if ulaw is not None:
+                self._remember(key, ulaw)
+        else:
+            self._memory.move_to_end(key)
+
+        if ulaw is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return ulaw
+
+    async def put(self, key, ulaw, persist=False):
+        """Store rendered audio; persisted entries are also written to disk"""
+        if not ulaw:
+            return
+        self._remember(key, ulaw)
+        if persist:
+            try:
+                await asyncio.to_thread(self._write, key, ulaw)
+            except OSError as e:
+                logger.warning(f"TTS cache write failed: {e}")
+
+    def stats(self):
+        return {"items": len(self._memory), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,54 @@
+"""
+TTS output formats - ask each provider for the audio closest to Twilio's wire format
+"""
+import os
+
+TTS_NATIVE_ULAW = os.getenv("TTS_NATIVE_ULAW", "1") == "1"  # 0 = always request PCM and transcode locally
+
+# Twilio Media Streams carry 8 kHz μ-law; AudioBridge can produce it from PCM16 16k
+WIRE_FORMAT = ("mulaw", 8000)
+TRANSCODABLE = {("pcm16", 16000)}
+
+class TtsFormat:
+    __slots__ = ("provider", "name", "encoding", "sample_rate", "cache_id")
+
+    def __init__(self, provider, name, encoding, sample_rate, cache_id=None):
+        self.provider = provider
+        self.name = name              # value the provider's API expects
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.cache_id = cache_id or name
+
+    @property
+    def native_ulaw(self):
+        return (self.encoding, self.sample_rate) == WIRE_FORMAT
+
+    def cost(self):
+        """0 = send as is, 1 = needs local transcoding, None = unusable"""
+        if self.native_ulaw:
+            return 0
+        if (self.encoding, self.sample_rate) in TRANSCODABLE:
+            return 1
+        return None
+
+    def __repr__(self):
+        return f"TtsFormat({self.provider}:{self.name})"
+
+# What each provider can render, in the order we would like it
+PROVIDER_FORMATS = {
+    "azure": (
+        TtsFormat("azure", "raw-8khz-8bit-mono-mulaw", "mulaw", 8000),
+        TtsFormat("azure", "raw-16khz-16bit-mono-pcm", "pcm16", 16000),
+    ),
+    "retell": (
+        TtsFormat("retell", "pcm_16k", "pcm16", 16000, cache_id="retell:pcm_16k"),
+    ),
+}
+
+def negotiate(provider, native_ulaw=TTS_NATIVE_ULAW):
+    """Cheapest format of ``provider`` that ends up as Twilio wire audio"""
+    usable = [f for f in PROVIDER_FORMATS[provider]
+              if f.cost() is not None and (native_ulaw or not f.native_ulaw)]
+    if not usable:
+        raise ValueError(f"No TTS output format of {provider} can be played to Twilio")
+    return min(usable, key=TtsFormat.cost)
@@ -0,0 +1,55 @@
+"""
+Async Twilio REST wrapper - runs the blocking twilio client in a bounded thread pool
+"""
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from twilio.rest import Client
+
+logger = logging.getLogger(__name__)
+
+TWILIO_REST_WORKERS = int(os.getenv("TWILIO_REST_WORKERS", "8"))
+
+class AsyncTwilioClient:
+    """Awaitable front end for ``twilio.rest.Client``.
+
+    The twilio SDK does blocking HTTP on a shared requests session, so every
+    REST call is handed to a small dedicated executor. Dialing bursts queue up
+    there instead of stalling the event loop and the media streams on it; at
+    most ``max_workers`` requests are in flight at once.
+    """
+
+    def __init__(self, account_sid, auth_token, max_workers=TWILIO_REST_WORKERS):
+        self.client = Client(account_sid, auth_token)
+        self.max_workers = max_workers
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="twilio-rest")
+        return self._executor
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def create_call(self, **kwargs):
+        """``client.calls.create(**kwargs)`` off the event loop"""
+        return await self._run(self.client.calls.create, **kwargs)
+
+    async def fetch_call(self, call_sid):
+        """Current call resource (status, duration, ...) for a Call SID"""
+        return await self._run(self.client.calls(call_sid).fetch)
+
+    async def update_call(self, call_sid, **kwargs):
+        """``client.calls(call_sid).update(**kwargs)``, e.g. ``status="completed"`` to hang up"""
+        return await self._run(self.client.calls(call_sid).update, **kwargs)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            logger.info("Twilio REST executor shut down")
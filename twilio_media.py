@@ -0,0 +1,50 @@
+"""
+Twilio Media Streams wire format - allocation-light encode/decode of media events
+"""
+import json
+from binascii import a2b_base64, b2a_base64
+
+_MEDIA_EVENT = '"event":"media"'
+_PAYLOAD_KEY = '"payload":"'
+_TRACK_KEY = '"track":"'
+
+class MediaEnvelope:
+    """Pre-rendered outbound media message for one stream.
+
+    The JSON around the payload never changes for a stream, so it is
+    rendered once and each frame only costs a base64 encode and a join.
+    """
+
+    def __init__(self, stream_sid):
+        self.stream_sid = stream_sid
+        sid = json.dumps(stream_sid)
+        self.prefix = '{"event":"media","streamSid":' + sid + ',"media":{"payload":"'
+        self.suffix = '"}}'
+
+    def media(self, frame) -> str:
+        """Message for one μ-law frame (bytes or memoryview)"""
+        return self.prefix + b2a_base64(frame, newline=False).decode("ascii") + self.suffix
+
+def parse_media(message: str):
+    """Fast path for inbound ``media`` events.
+
+    Returns ``(track, payload_bytes)`` without decoding the whole JSON
+    document, or None when the message is not a media event in the
+    expected shape (the caller then falls back to ``json.loads``).
+    """
+    if _MEDIA_EVENT not in message[:40]:
+        return None
+    start = message.find(_PAYLOAD_KEY)
+    if start < 0:
+        return None
+    start += len(_PAYLOAD_KEY)
+    end = message.find('"', start)
+    if end < 0:
+        return None
+
+    track = "inbound"
+    track_start = message.find(_TRACK_KEY)
+    if track_start >= 0:
+        track_start += len(_TRACK_KEY)
+        track = message[track_start:message.find('"', track_start)]
+    return track, a2b_base64(message[start:end])